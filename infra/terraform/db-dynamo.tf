@@ -8,4 +8,24 @@ resource "aws_dynamodb_table" "inventory" {
     name = "sku"
     type = "S"
   }
+
+  # Stock holds (items keyed "hold#<id>") carry these two attributes; stock
+  # items do not, so the index below only contains holds, ordered by expiry.
+  attribute {
+    name = "hold_bucket"
+    type = "S"
+  }
+
+  attribute {
+    name = "expires_at"
+    type = "N"
+  }
+
+  global_secondary_index {
+    name               = "holds-by-expiry"
+    hash_key           = "hold_bucket"
+    range_key          = "expires_at"
+    projection_type    = "INCLUDE"
+    non_key_attributes = ["lines"]
+  }
 }
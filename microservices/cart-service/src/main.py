@@ -1,25 +1,31 @@
 import logging
 import os
 import ssl
-from typing import List
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
 from urllib.parse import urlparse
 
+_IMPORT_STARTED = time.perf_counter()
+
+from anyio import to_thread
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
-from .store import InMemoryCartStore, RedisCartStore
+from .admission import admit_app
+from .health import HealthMonitor
+from .metrics import instrument_app
+from .store import REDIS_SECONDS, InMemoryCartStore, RedisCartStore
+from .tracing import trace_app
 
-try:
-    import redis  # type: ignore
-    from redis.exceptions import RedisError  # type: ignore
-except Exception:  # pragma: no cover
-    redis = None
 
-    class RedisError(Exception):
-        """Fallback Redis error when redis client is unavailable."""
-        pass
+class RedisError(Exception):
+    """Fallback Redis error; replaced by redis.exceptions.RedisError once redis is imported."""
+    pass
 
 # No RabbitMQ publisher for cart-service (synchronous only)
 
@@ -57,9 +63,19 @@ def getenv_float(key: str, default: float) -> float:
 HOST = os.getenv("HOST", "127.0.0.1")
 PORT = int(os.getenv("PORT", "8080"))
 CART_USE_REDIS = getenv_bool("CART_USE_REDIS", False)
+# Worker processes started by serve.py; with more than one, carts must not fall back to memory.
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "1"))
 CART_REDIS_URL = os.getenv("CART_REDIS_URL", "redis://localhost:6379/0")
 CART_REDIS_SKIP_VERIFY = getenv_bool("CART_REDIS_SKIP_VERIFY", True)
 CART_REDIS_SOCKET_TIMEOUT = getenv_float("CART_REDIS_SOCKET_TIMEOUT", 2.0)
+# Redis is PINGed in the background; probes read the cached result (0 = PING per probe)
+HEALTH_CHECK_INTERVAL = getenv_float("HEALTH_CHECK_INTERVAL", 5.0)
+HEALTH_MAX_AGE = getenv_float("HEALTH_MAX_AGE", 0.0) or None
+# Threads running sync routes, per worker process (serve.py runs one worker per CPU)
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+# Admission control (admission.py): requests in flight per worker, and the Redis p95 above which cart writes are shed
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", str(THREADPOOL_SIZE)))
+SHED_LATENCY_MS = getenv_float("SHED_LATENCY_MS", 100.0)
 DATABASE_URL = os.getenv("DATABASE_URL", "")
 
 
@@ -98,13 +114,17 @@ def _mask_url(url: str) -> str:
 
 
 def _build_store():
+    global RedisError
     if not CART_USE_REDIS:
         logger.info("Redis disabled, using in-memory cart store")
         return InMemoryCartStore(), "memory"
 
-    if redis is None:
-        logger.warning("redis library unavailable, falling back to in-memory store")
-        return InMemoryCartStore(), "memory"
+    # Imported here rather than at module load: nothing needs redis until the backend is built.
+    try:
+        import redis  # type: ignore
+        from redis.exceptions import RedisError  # type: ignore
+    except Exception:
+        return _memory_fallback("redis library unavailable")
 
     redis_kwargs = {
         "decode_responses": False,
@@ -112,6 +132,8 @@ def _build_store():
         "socket_connect_timeout": CART_REDIS_SOCKET_TIMEOUT,
         "health_check_interval": 30,
         "retry_on_timeout": True,
+        # Every route thread may hold a connection, plus the health check and warm-up threads.
+        "max_connections": THREADPOOL_SIZE + 2,
     }
 
     if CART_REDIS_SKIP_VERIFY:
@@ -130,16 +152,82 @@ def _build_store():
     except Exception as exc:  # pragma: no cover - defensive
         logger.error("Unexpected error initializing Redis backend: %s", exc, exc_info=True)
 
-    logger.warning("Falling back to in-memory cart store")
+    return _memory_fallback("Redis backend unavailable")
+
+
+def _memory_fallback(reason: str):
+    if SERVE_WORKERS > 1:
+        # Each worker would keep its own carts; stay unready and retry Redis on the next call instead.
+        raise RuntimeError(f"{reason}; not falling back to in-memory carts with {SERVE_WORKERS} workers")
+    logger.warning("%s, falling back to in-memory cart store", reason)
     return InMemoryCartStore(), "memory"
 
 
-store, STORE_BACKEND = _build_store()
-app = FastAPI(title="cart-service")
+# Set-up cost reported by /readyz: seconds from import to serving and to a usable backend.
+STARTUP: Dict[str, Optional[float]] = {"import_seconds": None, "serving_seconds": None, "backend_init_seconds": None, "ready_seconds": None}
+
+_store = None
+_store_lock = threading.Lock()
+STORE_BACKEND = "pending"
+
+
+def get_store():
+    """Return the cart store, connecting to Redis on first use instead of at import."""
+    global _store, STORE_BACKEND
+    if _store is not None:
+        return _store
+    with _store_lock:
+        if _store is None:
+            started = time.perf_counter()
+            built, STORE_BACKEND = _build_store()
+            _store = built
+            STARTUP["backend_init_seconds"] = round(time.perf_counter() - started, 3)
+            STARTUP["ready_seconds"] = round(time.perf_counter() - _IMPORT_STARTED, 3)
+            logger.info("Cart store ready after %.3fs (backend init %.3fs)", STARTUP["ready_seconds"], STARTUP["backend_init_seconds"])
+    return _store
+
+
+# The first background check also connects the store, so it doubles as the warm-up.
+health = HealthMonitor(lambda: get_store().ping(), interval=HEALTH_CHECK_INTERVAL, max_age=HEALTH_MAX_AGE)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    STARTUP["serving_seconds"] = round(time.perf_counter() - _IMPORT_STARTED, 3)
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    logger.info("Serving after %.3fs; connecting the cart store in the background", STARTUP["serving_seconds"])
+    if HEALTH_CHECK_INTERVAL > 0:
+        health.start()
+    else:
+        threading.Thread(target=get_store, name="store-warm-up", daemon=True).start()
+    yield
+    health.stop()
+    try:
+        if _store:
+            _store.close()
+    except Exception:
+        pass
+
+
+app = FastAPI(title="cart-service", lifespan=lifespan)
+instrument_app(app)
+trace_app(app)
+admit_app(
+    app,
+    limited=(
+        "POST /cart/{user_id}/items",
+        "PUT /cart/{user_id}/items/{product_id}",
+        "DELETE /cart/{user_id}/items/{product_id}",
+        "POST /cart/{user_id}/checkout",
+    ),
+    backend=REDIS_SECONDS,
+    shed_latency_ms=SHED_LATENCY_MS,
+    max_concurrency=MAX_CONCURRENCY,
+)
 
 
 def _cart_to_response(user_id: str) -> CartResponse:
-    raw = store.get_cart(user_id)
+    raw = get_store().get_cart(user_id)
     items: List[CartItemOut] = []
     item_count = 0
     subtotal = 0.0
@@ -154,17 +242,24 @@ def _cart_to_response(user_id: str) -> CartResponse:
 
 
 @app.get("/healthz")
-def healthz():
-    try:
-        if store:
-            store.ping()
-        return {"ok": True, "backend": STORE_BACKEND}
-    except RedisError as exc:
-        logger.error("Redis health check failed: %s", exc, exc_info=True)
-        return JSONResponse(status_code=503, content={"ok": False, "backend": STORE_BACKEND, "error": "backend unavailable"})
-    except Exception as exc:  # pragma: no cover - defensive
-        logger.error("Health check failed: %s", exc, exc_info=True)
-        return JSONResponse(status_code=503, content={"ok": False, "backend": STORE_BACKEND, "error": "unexpected failure"})
+async def healthz():
+    """Liveness: served from memory, never touches Redis."""
+    return {
+        "ok": True,
+        "backend": STORE_BACKEND,
+        "ready": _store is not None,
+        "check": health.status() if health.running else None,
+    }
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness from the cached background check (store connected and answering PING)."""
+    check = health.status() if health.running else await run_in_threadpool(health.status)
+    body = {"ok": check["ok"], "backend": STORE_BACKEND, "check": check, "startup": STARTUP}
+    if not check["ok"]:
+        return JSONResponse(status_code=503, content=body)
+    return body
 
 
 @app.get("/cart/{user_id}", response_model=CartResponse)
@@ -179,7 +274,7 @@ def get_cart(user_id: str):
 @app.post("/cart/{user_id}/items", response_model=CartResponse)
 def add_item(user_id: str, body: AddItemRequest):
     try:
-        store.add_item(user_id, body.productId, body.quantity, body.price)
+        get_store().add_item(user_id, body.productId, body.quantity, body.price)
         return _cart_to_response(user_id)
     except RedisError as exc:
         logger.error("Failed to add item to cart %s: %s", user_id, exc, exc_info=True)
@@ -189,7 +284,7 @@ def add_item(user_id: str, body: AddItemRequest):
 @app.put("/cart/{user_id}/items/{product_id}", response_model=CartResponse)
 def update_item(user_id: str, product_id: str, body: UpdateQuantityRequest):
     try:
-        store.update_item(user_id, product_id, body.quantity)
+        get_store().update_item(user_id, product_id, body.quantity)
         return _cart_to_response(user_id)
     except RedisError as exc:
         logger.error("Failed to update item %s in cart %s: %s", product_id, user_id, exc, exc_info=True)
@@ -199,7 +294,7 @@ def update_item(user_id: str, product_id: str, body: UpdateQuantityRequest):
 @app.delete("/cart/{user_id}/items/{product_id}", response_model=CartResponse)
 def delete_item(user_id: str, product_id: str):
     try:
-        store.remove_item(user_id, product_id)
+        get_store().remove_item(user_id, product_id)
         return _cart_to_response(user_id)
     except RedisError as exc:
         logger.error("Failed to delete item %s from cart %s: %s", product_id, user_id, exc, exc_info=True)
@@ -210,20 +305,14 @@ def delete_item(user_id: str, product_id: str):
 def checkout(user_id: str):
     try:
         cart = _cart_to_response(user_id)
-        store.clear(user_id)
+        get_store().clear(user_id)
         return cart
     except RedisError as exc:
         logger.error("Failed to checkout cart %s: %s", user_id, exc, exc_info=True)
         raise HTTPException(status_code=503, detail="cart backend unavailable") from exc
 
 
-@app.on_event("shutdown")
-def shutdown_event():  # pragma: no cover - I/O only
-    try:
-        if store:
-            store.close()
-    except Exception:
-        pass
+STARTUP["import_seconds"] = round(time.perf_counter() - _IMPORT_STARTED, 3)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,387 @@
+"""Minimal Prometheus instrumentation (text exposition format 0.0.4), stdlib only.
+
+Metrics live in process memory. When serve.py runs several workers it sets
+METRICS_MULTIPROC_DIR: every worker then writes its series there about once a
+second and `/metrics` serves the sum over all workers, whichever one answers
+the scrape. When a worker exits, serve.py folds its counters and histograms
+into exited.json and its gauges are dropped. `REGISTRY.render()` returns what `/metrics` serves, so tests can
+assert on it in-process without a scrape.
+"""
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Request/backend latencies: 1 ms .. 10 s.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+MULTIPROC_FLUSH_SECONDS = float(os.getenv("METRICS_MULTIPROC_FLUSH_SECONDS", "1"))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def collect(self) -> dict:
+        """Current series as a JSON-serialisable family: {name, kind, doc, labelnames, series: [[labels, value]]}."""
+        raise NotImplementedError
+
+    def _family(self, series: list, **extra) -> dict:
+        family = {"name": self.name, "kind": self.kind, "doc": self.documentation, "labelnames": list(self.labelnames), "series": series}
+        family.update(extra)
+        return family
+
+    def render(self) -> List[str]:
+        return _render_family(self.collect())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def collect(self) -> dict:
+        with self._lock:
+            return self._family([[list(key), value] for key, value in self._values.items()])
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    @contextmanager
+    def time(self, *labelvalues: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def count(self, *labelvalues: str) -> int:
+        series = self._series.get(labelvalues)
+        return sum(series[0]) if series else 0
+
+    def collect(self) -> dict:
+        # Histogram values are [bucket counts (not cumulative)..., sum].
+        with self._lock:
+            series = [[list(key), list(counts) + [total[0]]] for key, (counts, total) in self._series.items()]
+        return self._family(series, buckets=list(self.buckets))
+
+
+class CallbackMetric(_Metric):
+    """Gauge or counter read at scrape time from `callback`, which returns {labelvalues: value}.
+
+    Lets existing in-process counters (client stats, consumer stats) be exported
+    without touching their hot paths.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        callback: Callable[[], Dict[Tuple[str, ...], Optional[float]]],
+        kind: str = "gauge",
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def collect(self) -> dict:
+        try:
+            values = self.callback() or {}
+        except Exception:
+            values = {}
+        return self._family([[list(key), value] for key, value in values.items() if value is not None])
+
+
+def _render_family(family: dict) -> List[str]:
+    name, labelnames = family["name"], family["labelnames"]
+    lines = [f"# HELP {name} {family['doc']}", f"# TYPE {name} {family['kind']}"]
+    for key, value in sorted(family["series"], key=lambda entry: entry[0]):
+        if family["kind"] != "histogram":
+            lines.append(f"{name}{_labels(labelnames, key)} {_number(value)}")
+            continue
+        cumulative = 0
+        for bound, count in zip(family["buckets"] + [float("inf")], value[:-1]):
+            cumulative += count
+            le = 'le="%s"' % _number(bound)
+            lines.append(f"{name}_bucket{_labels(labelnames, key, le)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labelnames, key)} {_number(value[-1])}")
+        lines.append(f"{name}_count{_labels(labelnames, key)} {cumulative}")
+    return lines
+
+
+def _merge(families: List[dict], other: List[dict]) -> List[dict]:
+    """Sum `other` (another worker's families) into `families`, series by series."""
+    by_name = {family["name"]: family for family in families}
+    for family in other:
+        mine = by_name.get(family["name"])
+        if mine is None:
+            by_name[family["name"]] = family
+            families.append(family)
+            continue
+        series = {tuple(key): value for key, value in mine["series"]}
+        for key, value in family["series"]:
+            current = series.get(tuple(key))
+            if current is None:
+                series[tuple(key)] = value
+            elif isinstance(value, list):
+                series[tuple(key)] = [a + b for a, b in zip(current, value)]
+            else:
+                series[tuple(key)] = current + value
+        mine["series"] = [[list(key), value] for key, value in series.items()]
+    return families
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # Re-registering (module reloads, repeated app set-up in tests) keeps the first instance.
+            return self._metrics.setdefault(metric.name, metric)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def collect(self) -> List[dict]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [metric.collect() for metric in metrics]
+
+    def write(self, directory: str) -> None:
+        """Publish this process's series to `directory` for the other workers' scrapes."""
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as fh:
+            json.dump(self.collect(), fh)
+        os.replace(path + ".tmp", path)
+
+    def render(self) -> str:
+        families = self.collect()
+        if MULTIPROC_DIR:
+            self.write(MULTIPROC_DIR)
+            workers = {}
+            for path in glob.glob(os.path.join(MULTIPROC_DIR, "*.json")):
+                name = os.path.basename(path)[:-len(".json")]
+                if not name.isdigit():
+                    continue
+                try:
+                    with open(path) as fh:
+                        workers[int(name)] = json.load(fh)
+                except (OSError, ValueError):
+                    continue
+            # Read after the worker files: a file missing above was folded in
+            # before it was removed, and one folded since is skipped here.
+            exited = _read_exited(MULTIPROC_DIR)
+            families = exited["families"]
+            for pid in sorted(workers):
+                if pid in exited["pids"]:
+                    continue
+                # A worker gone without child_exit (crash, uvicorn fallback) keeps its counters only.
+                other = workers[pid] if _alive(pid) else _cumulative(workers[pid])
+                families = _merge(families, other)
+        lines: List[str] = []
+        for family in families:
+            lines.extend(_render_family(family))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+EXITED_FILE = "exited.json"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # alive, owned by another user
+        pass
+    return True
+
+
+def _cumulative(families: List[dict]) -> List[dict]:
+    """Drop gauges: they describe a process that no longer exists."""
+    return [family for family in families if family["kind"] in ("counter", "histogram")]
+
+
+def _read_exited(directory: str) -> dict:
+    try:
+        with open(os.path.join(directory, EXITED_FILE)) as fh:
+            exited = json.load(fh)
+        return {"pids": set(exited["pids"]), "families": exited["families"]}
+    except (OSError, ValueError, KeyError, TypeError):
+        return {"pids": set(), "families": []}
+
+
+def mark_process_dead(pid: int, directory: Optional[str] = None) -> None:
+    """Fold an exited worker's counters into exited.json and remove its file.
+
+    Pod-level counters never go backwards, the worker's gauges stop being
+    served and recycled workers do not pile up files. Called from the gunicorn
+    master's child_exit hook (serve.py), the only writer of exited.json.
+    """
+    directory = directory or MULTIPROC_DIR
+    if not directory:
+        return
+    path = os.path.join(directory, f"{pid}.json")
+    try:
+        with open(path) as fh:
+            families = _cumulative(json.load(fh))
+    except (OSError, ValueError):
+        families = []
+    exited = _read_exited(directory)
+    # Pids folded earlier have no file left to skip; keep only this one so a
+    # recycled pid is not ignored later.
+    state = {"pids": [pid], "families": _merge(exited["families"], families)}
+    target = os.path.join(directory, EXITED_FILE)
+    with open(target + ".tmp", "w") as fh:
+        json.dump(state, fh)
+    os.replace(target + ".tmp", target)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_writer_pid = 0
+
+
+def _write_periodically() -> None:
+    while True:
+        time.sleep(MULTIPROC_FLUSH_SECONDS)
+        try:
+            REGISTRY.write(MULTIPROC_DIR)
+        except OSError:
+            pass
+
+
+def _ensure_writer() -> None:
+    """Start this worker's writer thread on its first request.
+
+    Keyed on the pid because gunicorn forks workers from a preloaded master
+    (threads do not survive the fork); the master itself serves nothing and
+    never writes.
+    """
+    global _writer_pid
+    if MULTIPROC_DIR and _writer_pid != os.getpid():
+        _writer_pid = os.getpid()
+        threading.Thread(target=_write_periodically, name="metrics-writer", daemon=True).start()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))  # type: ignore[return-value]
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))  # type: ignore[return-value]
+
+
+def callback_metric(name: str, documentation: str, labelnames: Sequence[str], callback, kind: str = "gauge") -> CallbackMetric:
+    return REGISTRY.register(CallbackMetric(name, documentation, labelnames, callback, kind))  # type: ignore[return-value]
+
+
+def timed(metric: Histogram, *labelvalues: str):
+    """Decorator recording the call duration in `metric`, whether it returns or raises."""
+
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metric.observe(time.perf_counter() - started, *labelvalues)
+
+        return wrapper
+
+    return decorate
+
+
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ("method", "route", "status"),
+)
+
+
+def instrument_app(app, skip: Iterable[str] = ("/metrics",)) -> None:
+    """Time every request by route template (`/cart/{user_id}`, not the raw path) and serve `/metrics`."""
+    from fastapi import Request, Response
+
+    skipped = set(skip)
+
+    @app.middleware("http")
+    async def record_latency(request: Request, call_next):
+        _ensure_writer()
+        started = time.perf_counter()
+        status = "500"
+        try:
+            response = await call_next(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            route = request.scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            if template not in skipped:
+                HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, template, status)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics() -> Response:
+        return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
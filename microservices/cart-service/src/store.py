@@ -1,6 +1,12 @@
 import json
 from typing import Dict, Any, Optional
 
+from .metrics import histogram, timed
+from .tracing import traced
+
+
+REDIS_SECONDS = histogram("cart_redis_operation_seconds", "RedisCartStore operation latency.", ("operation",))
+
 
 class InMemoryCartStore:
     def __init__(self):
@@ -52,6 +58,8 @@ class RedisCartStore:
     def _key(self, user_id: str) -> str:
         return f"cart:{user_id}"
 
+    @timed(REDIS_SECONDS, "get_cart")
+    @traced("redis.get_cart")
     def get_cart(self, user_id: str) -> Dict[str, Dict[str, Any]]:
         data = self.r.hgetall(self._key(user_id))
         # decode bytes to str and parse json
@@ -65,6 +73,8 @@ class RedisCartStore:
             cart[pid] = item
         return cart
 
+    @timed(REDIS_SECONDS, "add_item")
+    @traced("redis.add_item")
     def add_item(self, user_id: str, product_id: str, quantity: int, price: float):
         key = self._key(user_id)
         current_raw: Optional[bytes] = self.r.hget(key, product_id)
@@ -79,6 +89,8 @@ class RedisCartStore:
             item = {"quantity": quantity, "price": price}
         self.r.hset(key, product_id, json.dumps(item))
 
+    @timed(REDIS_SECONDS, "update_item")
+    @traced("redis.update_item")
     def update_item(self, user_id: str, product_id: str, quantity: int):
         key = self._key(user_id)
         if quantity <= 0:
@@ -94,12 +106,17 @@ class RedisCartStore:
         item["quantity"] = quantity
         self.r.hset(key, product_id, json.dumps(item))
 
+    @timed(REDIS_SECONDS, "remove_item")
+    @traced("redis.remove_item")
     def remove_item(self, user_id: str, product_id: str):
         self.r.hdel(self._key(user_id), product_id)
 
+    @timed(REDIS_SECONDS, "clear")
+    @traced("redis.clear")
     def clear(self, user_id: str):
         self.r.delete(self._key(user_id))
 
+    @timed(REDIS_SECONDS, "ping")
     def ping(self) -> bool:
         return bool(self.r.ping())
 
@@ -0,0 +1,327 @@
+"""Request tracing with W3C `traceparent` propagation, stdlib only.
+
+A span measures one operation (an HTTP request, a DynamoDB call, a publish)
+and nests under the span that was current when it started; the current span
+lives in a contextvar, so it follows requests into `run_in_threadpool`.
+Context crosses process boundaries as a `traceparent` header: `inject()` adds
+it to outgoing HTTP headers and AMQP message headers, and `span(parent=...)`
+continues a trace from an incoming one. The business `correlationId` travels
+alongside as `X-Correlation-ID` / the AMQP correlation id and is recorded on
+the spans.
+
+Sampling is decided once per trace, at its first span: TRACE_SAMPLE_RATE of
+new traces are recorded, and a `traceparent` from upstream keeps the caller's
+decision. With TRACE_SLOW_MS set, every trace is recorded and unsampled ones
+are still exported when their local root took at least that long. Unsampled,
+unrecorded spans only carry ids, so tracing costs a few microseconds per span.
+
+Each process exports one record per trace segment (the spans under one local
+root) to an in-memory ring buffer served at `/debug/traces` and, with
+TRACE_EXPORTER=file, as JSON lines to TRACE_FILE. Segments of the same request
+from different services share `trace_id`.
+"""
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+SERVICE = "cart-service"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+# Also export unsampled traces at least this slow (0 = off; recording every trace costs a little more)
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "0"))
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "memory").lower()  # memory | file | none
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "500"))
+
+TRACEPARENT = "traceparent"
+CORRELATION_HEADER = "X-Correlation-ID"
+
+
+class _Segment:
+    """Spans of one trace recorded in this process under a single local root."""
+
+    __slots__ = ("spans", "sampled", "recording", "correlation_id")
+
+    def __init__(self, sampled: bool, recording: bool):
+        self.spans: List["Span"] = []
+        self.sampled = sampled
+        self.recording = recording
+        self.correlation_id: Optional[str] = None
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "error", "started", "wall_started", "seconds", "_segment")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], segment: _Segment):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.attributes: Dict[str, object] = {}
+        self.error: Optional[str] = None
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.seconds: Optional[float] = None
+        self._segment = segment
+
+    @property
+    def sampled(self) -> bool:
+        return self._segment.sampled
+
+    def set(self, key: str, value: object) -> None:
+        if self._segment.recording:
+            self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def as_dict(self, origin: float) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "offset_ms": round((self.started - origin) * 1000, 3),
+            "duration_ms": round((self.seconds or 0.0) * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace_id, parent span_id, sampled) from a `traceparent` value, or None if absent/invalid."""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or parts[1] == "0" * 32:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def set_attribute(key: str, value: object) -> None:
+    span_ = _current.get()
+    if span_ is not None:
+        span_.set(key, value)
+
+
+def set_correlation_id(value: Optional[str]) -> None:
+    """Tag the current trace segment with the business correlation id; `inject()` forwards it."""
+    span_ = _current.get()
+    if span_ is not None and value:
+        span_._segment.correlation_id = str(value)
+
+
+class span:
+    """Time the block as a child of the current span, or of `parent` (a traceparent value).
+
+    With neither, a new trace starts here and the sampling decision is made.
+    Exceptions are recorded on the span and re-raised. A class rather than a
+    generator context manager: this sits on every traced call.
+    """
+
+    __slots__ = ("name", "parent", "attributes", "_span", "_token", "_root")
+
+    def __init__(self, name: str, parent: Optional[str] = None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+
+    def __enter__(self) -> Span:
+        current = _current.get()
+        if current is not None:
+            segment, trace_id, parent_id = current._segment, current.trace_id, current.span_id
+        else:
+            remote = parse_traceparent(self.parent)
+            if remote is not None:
+                trace_id, parent_id, sampled = remote
+            else:
+                trace_id, parent_id, sampled = "%032x" % random.getrandbits(128), None, random.random() < TRACE_SAMPLE_RATE
+            segment = _Segment(sampled, recording=sampled or TRACE_SLOW_MS > 0)
+        span_ = Span(self.name, trace_id, parent_id, segment)
+        if segment.recording and self.attributes:
+            span_.attributes.update(self.attributes)
+        self._span, self._root = span_, current is None
+        self._token = _current.set(span_)
+        return span_
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        span_ = self._span
+        span_.seconds = time.perf_counter() - span_.started
+        _current.reset(self._token)
+        if exc_type is not None:
+            span_.error = exc_type.__name__
+        segment = span_._segment
+        if segment.recording:
+            segment.spans.append(span_)
+            if self._root:
+                _finish(span_, segment)
+
+
+def traced(name: str):
+    """Decorator running the call inside `span(name)` when it happens within a trace.
+
+    Backend calls made outside any request (health checks, sweeps) stay untraced.
+    """
+
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def inject(headers: Optional[dict] = None) -> dict:
+    """Add `traceparent` (and the correlation id, when known) for the current span to `headers`."""
+    headers = {} if headers is None else headers
+    span_ = _current.get()
+    if span_ is not None:
+        headers[TRACEPARENT] = span_.traceparent()
+        if span_._segment.correlation_id:
+            headers[CORRELATION_HEADER] = span_._segment.correlation_id
+    return headers
+
+
+# -- export ---------------------------------------------------------------------
+
+
+class MemoryExporter:
+    """Keep the last `size` segments for `/debug/traces`."""
+
+    def __init__(self, size: int = 500):
+        self._records: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def export(self, record: dict) -> None:
+        with self._lock:
+            self._records.append(record)
+
+    def recent(self, limit: int = 50, min_ms: float = 0.0, trace_id: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            records = list(self._records)
+        matches = [
+            record for record in reversed(records)
+            if record["duration_ms"] >= min_ms and (trace_id is None or record["trace_id"] == trace_id)
+        ]
+        return matches[:limit]
+
+
+class FileExporter(MemoryExporter):
+    """Also append every segment as a JSON line to `path`, written off the request path.
+
+    The writer thread starts on the first export in each process: gunicorn forks
+    workers from a preloaded master, and threads do not survive the fork.
+    """
+
+    def __init__(self, path: str, size: int = 500):
+        super().__init__(size)
+        self.path = path
+        self._queue: "queue.SimpleQueue[dict]" = queue.SimpleQueue()
+        self._writer_pid = 0
+
+    def export(self, record: dict) -> None:
+        super().export(record)
+        if self._writer_pid != os.getpid():
+            self._start_writer()
+        self._queue.put(record)
+
+    def _start_writer(self) -> None:
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+            # Records queued in the master before the fork belong to it, not to this worker.
+            self._queue = queue.SimpleQueue()
+            threading.Thread(target=self._write, args=(self._queue,), name="trace-writer", daemon=True).start()
+
+    def _write(self, pending: "queue.SimpleQueue[dict]") -> None:
+        while True:
+            records = [pending.get()]
+            while len(records) < 1000:
+                try:
+                    records.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.path, "a") as fh:
+                    fh.writelines(json.dumps(record, default=str) + "\n" for record in records)
+            except OSError:
+                pass  # tracing must never take the service down
+
+
+def _build_exporter() -> Optional[MemoryExporter]:
+    if TRACE_EXPORTER == "none":
+        return None
+    if TRACE_EXPORTER == "file":
+        return FileExporter(TRACE_FILE, TRACE_BUFFER_SIZE)
+    return MemoryExporter(TRACE_BUFFER_SIZE)
+
+
+EXPORTER: Optional[MemoryExporter] = _build_exporter()
+
+
+def _finish(root: Span, segment: _Segment) -> None:
+    duration_ms = (root.seconds or 0.0) * 1000
+    if EXPORTER is None or not (segment.sampled or (TRACE_SLOW_MS and duration_ms >= TRACE_SLOW_MS)):
+        return
+    spans = sorted(segment.spans, key=lambda item: item.started)
+    EXPORTER.export({
+        "service": SERVICE,
+        "trace_id": root.trace_id,
+        "name": root.name,
+        "correlation_id": segment.correlation_id,
+        "start": root.wall_started,
+        "duration_ms": round(duration_ms, 3),
+        "sampled": segment.sampled,
+        "spans": [item.as_dict(root.started) for item in spans],
+    })
+
+
+def trace_app(app, skip: Iterable[str] = ("/healthz", "/readyz", "/metrics", "/debug/traces")) -> None:
+    """Open a server span per request (continuing an incoming `traceparent`) and serve `/debug/traces`."""
+    from fastapi import Request
+
+    skipped = set(skip)
+
+    @app.middleware("http")
+    async def trace_request(request: Request, call_next):
+        if request.url.path in skipped:
+            return await call_next(request)
+        with span(f"{request.method} {request.url.path}", parent=request.headers.get(TRACEPARENT)) as server:
+            set_correlation_id(request.headers.get(CORRELATION_HEADER))
+            response = await call_next(request)
+            route = request.scope.get("route")
+            # Name by route template so `/cart/{user_id}` groups across users.
+            server.name = f"{request.method} {getattr(route, 'path', None) or request.url.path}"
+            server.set("http.status", response.status_code)
+            response.headers["X-Trace-Id"] = server.trace_id
+            return response
+
+    @app.get("/debug/traces", include_in_schema=False)
+    async def debug_traces(limit: int = 50, min_ms: float = 0.0, trace_id: Optional[str] = None):
+        if EXPORTER is None:
+            return {"exporter": "none", "traces": []}
+        return {"exporter": TRACE_EXPORTER, "traces": EXPORTER.recent(limit, min_ms, trace_id)}
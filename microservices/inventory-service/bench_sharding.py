@@ -0,0 +1,135 @@
+"""Compare the single-item and sharded stock layouts under concurrent orders.
+
+Runs against any DynamoDB endpoint; DynamoDB Local is the intended target:
+
+    docker run -p 8000:8000 amazon/dynamodb-local
+    DDB_ENDPOINT_URL=http://localhost:8000 AWS_REGION=us-east-1 \
+        AWS_ACCESS_KEY_ID=x AWS_SECRET_ACCESS_KEY=x python bench_sharding.py --shards 8
+
+Every worker thread orders 1 unit of the same SKU in a loop. One JSON line is
+printed per layout with throughput, latency percentiles and error counts.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Ensure src is on the path
+ROOT = Path(__file__).resolve().parent
+SRC = ROOT / "src"
+sys.path.insert(0, str(SRC))
+
+from store import (  # noqa: E402
+    MAX_SHARDS,
+    DynamoInventoryStore,
+    InventoryStoreError,
+    OutOfStockError,
+    open_table,
+    shard_key,
+)
+
+
+def _ensure_table(table) -> None:
+    client = table.meta.client
+    try:
+        client.describe_table(TableName=table.name)
+        return
+    except client.exceptions.ResourceNotFoundException:
+        pass
+    client.create_table(
+        TableName=table.name,
+        AttributeDefinitions=[{"AttributeName": "sku", "AttributeType": "S"}],
+        KeySchema=[{"AttributeName": "sku", "KeyType": "HASH"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    client.get_waiter("table_exists").wait(TableName=table.name)
+
+
+def _percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_layout(table, sku: str, shards: int, stock: int, threads: int, duration: float) -> dict:
+    # Reset the SKU to a single item, then reshard to the layout under test.
+    with table.batch_writer() as batch:
+        for index in range(MAX_SHARDS):
+            batch.delete_item(Key={"sku": shard_key(sku, index)})
+    table.put_item(Item={"sku": sku, "stock": stock, "updated_at": datetime.now(timezone.utc).isoformat()})
+    store = DynamoInventoryStore(table, sharding=shards > 0)
+    if shards:
+        store.reshard(sku, shards)
+
+    latencies = []
+    counters = {"ok": 0, "out_of_stock": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        local_latencies = []
+        local = {"ok": 0, "out_of_stock": 0, "errors": 0}
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                store.apply({sku: 1})
+                local["ok"] += 1
+            except OutOfStockError:
+                local["out_of_stock"] += 1
+            except InventoryStoreError:
+                local["errors"] += 1
+            local_latencies.append((time.perf_counter() - started) * 1000.0)
+        with lock:
+            latencies.extend(local_latencies)
+            for key, value in local.items():
+                counters[key] += value
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.monotonic()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    remaining = store.get_stock(sku)
+    return {
+        "layout": f"sharded-{shards}" if shards else "single",
+        "threads": threads,
+        "seconds": round(elapsed, 2),
+        "orders_per_sec": round(counters["ok"] / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 50), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+        **counters,
+        # Must hold for every layout: nothing oversold, nothing lost.
+        "consistent": remaining == stock - counters["ok"],
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--table", default=os.getenv("DDB_TABLE", "bench-inventory"))
+    parser.add_argument("--sku", default="BENCH-HOT-SKU")
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--stock", type=int, default=1_000_000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    region = os.getenv("AWS_REGION") or os.getenv("AWS_DEFAULT_REGION") or "us-east-1"
+    table = open_table(args.table, region, os.getenv("DDB_ENDPOINT_URL"))
+    _ensure_table(table)
+
+    for shards in (0, args.shards):
+        print(json.dumps(run_layout(table, args.sku, shards, args.stock, args.threads, args.duration)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
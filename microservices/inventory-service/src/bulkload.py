@@ -0,0 +1,183 @@
+import csv
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+
+FORMATS = ("csv", "ndjson")
+
+
+class StockFileError(ValueError):
+    """Raised when a stock file line cannot be parsed."""
+
+
+def detect_format(name: str = "", content_type: str = "") -> str:
+    """Guess the stock file format from a filename or Content-Type header."""
+    lowered = f"{name} {content_type}".lower()
+    if "ndjson" in lowered or "jsonl" in lowered or "json" in lowered:
+        return "ndjson"
+    return "csv"
+
+
+def _decoded(lines: Iterable[Union[str, bytes]]) -> Iterator[str]:
+    for line in lines:
+        if isinstance(line, (bytes, bytearray)):
+            line = line.decode("utf-8")
+        yield line
+
+
+def iter_records(lines: Iterable[Union[str, bytes]], fmt: str = "csv") -> Iterator[Tuple[str, int]]:
+    """Yield `(sku, qty)` pairs from CSV (`sku,stock` with optional header) or NDJSON lines.
+
+    Works line by line, so memory use is independent of the file size. NDJSON
+    objects may use `stock` or `qty` for the quantity.
+    """
+    if fmt not in FORMATS:
+        raise StockFileError(f"unsupported format {fmt!r}; expected one of {FORMATS}")
+
+    if fmt == "ndjson":
+        for number, line in enumerate(_decoded(lines), start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                qty = record.get("stock", record.get("qty"))
+                yield str(record["sku"]), int(qty)
+            except (ValueError, KeyError, TypeError, AttributeError) as exc:
+                raise StockFileError(f"line {number}: invalid record {line[:80]!r}") from exc
+        return
+
+    for number, row in enumerate(csv.reader(_decoded(lines)), start=1):
+        if not row or not row[0].strip():
+            continue
+        sku = row[0].strip()
+        if sku.lower() == "sku":  # header row
+            continue
+        try:
+            yield sku, int(row[1])
+        except (IndexError, ValueError) as exc:
+            raise StockFileError(f"line {number}: invalid record {','.join(row)[:80]!r}") from exc
+
+
+def iter_batches(records: Iterable[Tuple[str, int]], size: int, relative: bool = False) -> Iterator[Dict[str, int]]:
+    """Group records into dicts of at most `size` SKUs.
+
+    A SKU repeated within a batch is summed for relative loads and last-wins
+    for absolute ones, matching what applying the records one by one would do.
+    """
+    batch: Dict[str, int] = {}
+    for sku, qty in records:
+        batch[sku] = batch.get(sku, 0) + qty if relative else qty
+        if len(batch) >= size:
+            yield batch
+            batch = {}
+    if batch:
+        yield batch
+
+
+async def aiter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split an async stream of byte chunks (e.g. a request body) into lines."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        lines: List[bytes] = pending.split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+class LoadStats:
+    """Progress counters shared between the loader threads."""
+
+    def __init__(self):
+        self.records = 0
+        self.batches = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, records: int) -> None:
+        with self._lock:
+            self.records += records
+            self.batches += 1
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def as_dict(self) -> Dict[str, float]:
+        elapsed = self.elapsed
+        return {
+            "records": self.records,
+            "batches": self.batches,
+            "seconds": round(elapsed, 2),
+            "records_per_sec": round(self.records / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+def parallel_load(
+    store,
+    records: Iterable[Tuple[str, int]],
+    relative: bool = False,
+    batch_size: int = 100,
+    workers: int = 1,
+    progress: Optional[Callable[[LoadStats], None]] = None,
+    progress_interval: float = 5.0,
+) -> LoadStats:
+    """Restock `store` from `records` using `workers` threads.
+
+    At most `2 * workers` batches are in flight, so memory stays bounded no
+    matter how large the input is. The first failing batch stops the load and
+    its exception is re-raised once in-flight batches have finished.
+    """
+    stats = LoadStats()
+    workers = max(1, workers)
+    if workers == 1:
+        for batch in iter_batches(records, batch_size, relative=relative):
+            store.restock(batch, relative=relative)
+            stats.add(len(batch))
+        return stats
+
+    slots = threading.Semaphore(workers * 2)
+    errors: List[BaseException] = []
+    last_report = time.monotonic()
+
+    def run(batch: Dict[str, int]) -> None:
+        try:
+            if not errors:
+                store.restock(batch, relative=relative)
+                stats.add(len(batch))
+        except BaseException as exc:  # surfaced to the caller below
+            errors.append(exc)
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-load") as pool:
+        for batch in iter_batches(records, batch_size, relative=relative):
+            slots.acquire()
+            if errors:
+                slots.release()
+                break
+            pool.submit(run, batch)
+            if progress and time.monotonic() - last_report >= progress_interval:
+                last_report = time.monotonic()
+                progress(stats)
+    if errors:
+        raise errors[0]
+    return stats
+
+
+def load_lines(
+    store,
+    lines: Iterable[Union[str, bytes]],
+    fmt: str = "csv",
+    relative: bool = False,
+    batch_size: int = 100,
+    workers: int = 1,
+) -> int:
+    """Parse `lines` and restock `store` batch by batch; returns the number of records loaded."""
+    return parallel_load(store, iter_records(lines, fmt), relative, batch_size, workers).records
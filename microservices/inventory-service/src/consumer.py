@@ -0,0 +1,308 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from store import InvalidRequestError, InventoryStore, InventoryStoreError, OutOfStockError
+from tracing import TRACEPARENT, inject, set_correlation_id, span
+
+
+logger = logging.getLogger("inventory-service")
+
+ROUTING_KEY = "orders.order_created"
+UPDATED_QUEUE = "inventory.updated"
+
+
+class Delivery(NamedTuple):
+    tag: int
+    message_id: Optional[str]
+    body: bytes
+    headers: Optional[dict] = None
+
+
+def order_items(event: dict) -> Dict[str, int]:
+    """Aggregate `order.created` line items (`qty` or `quantity`) per SKU.
+
+    Raises ValueError for a malformed line: not an object, or a quantity that is not a number.
+    """
+    lines = event.get("items") or []
+    if not isinstance(lines, list):
+        raise ValueError("items is not a list")
+    items: Dict[str, int] = {}
+    for line in lines:
+        if not isinstance(line, dict):
+            raise ValueError("line item is not an object")
+        sku = line.get("sku")
+        try:
+            qty = int(line.get("qty", line.get("quantity", 0)) or 0)
+        except (TypeError, ValueError) as exc:
+            raise ValueError(f"bad quantity for {sku!r}") from exc
+        if sku and qty > 0:
+            items[sku] = items.get(sku, 0) + qty
+    return items
+
+
+def _pika_channel(rabbit_url: str, exchange: str, queue: str, prefetch: int):
+    import pika  # type: ignore
+
+    connection = pika.BlockingConnection(pika.URLParameters(rabbit_url))
+    channel = connection.channel()
+    channel.exchange_declare(exchange=exchange, exchange_type="topic", durable=True)
+    channel.queue_declare(queue=queue, durable=True)
+    channel.queue_bind(queue=queue, exchange=exchange, routing_key=ROUTING_KEY)
+    channel.queue_declare(queue=UPDATED_QUEUE, durable=True)
+    channel.basic_qos(prefetch_count=prefetch)
+    return channel
+
+
+class OrderCreatedConsumer:
+    """Drain `orders.order_created` in micro-batches and reserve stock per order.
+
+    Up to `batch_size` deliveries (or whatever arrived within `flush_interval`
+    seconds) are processed together: duplicates (by messageId / orderId) are
+    dropped, each remaining order is applied in its own store transaction on a
+    thread pool, `inventory.updated` is published for every outcome and the
+    batch is acked with a single `multiple=True` ack when nothing failed.
+
+    The in-process de-duplication only catches redeliveries to this consumer;
+    the store records each order id in the apply transaction itself, so a copy
+    delivered to another worker or replica is acked without touching stock.
+    Orders the store can never apply (e.g. too many SKUs) are failed with
+    `inventory.failed`; orders that hit any other store error are nacked and
+    requeued after an exponential backoff, which holds the consumer back while
+    the store is failing.
+
+    `connect` returns a pika-like channel and exists so the consumer can run
+    against a local broker stand-in.
+    """
+
+    def __init__(
+        self,
+        store: InventoryStore,
+        rabbit_url: str = "",
+        exchange: str = "orders",
+        queue: str = "inventory.order_created",
+        prefetch: int = 200,
+        batch_size: int = 100,
+        flush_interval: float = 0.05,
+        workers: int = 16,
+        publish: bool = True,
+        dedupe_size: int = 100_000,
+        requeue_backoff: float = 0.5,
+        requeue_backoff_max: float = 30.0,
+        connect: Optional[Callable[[], object]] = None,
+    ):
+        self.store = store
+        self.queue = queue
+        self.batch_size = max(1, min(batch_size, prefetch))
+        self.flush_interval = flush_interval
+        self.publish = publish
+        self.dedupe_size = dedupe_size
+        self.requeue_backoff = requeue_backoff
+        self.requeue_backoff_max = requeue_backoff_max
+        self._requeue_streak = 0
+        self._connect = connect or (lambda: _pika_channel(rabbit_url, exchange, queue, prefetch))
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="order-consumer")
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._counters = {"batches": 0, "orders": 0, "duplicates": 0, "out_of_stock": 0, "invalid_order": 0, "requeued": 0, "rejected": 0}
+
+    # -- lifecycle ----------------------------------------------------------
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="order-created-consumer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self._pool.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._counters)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            channel = None
+            try:
+                channel = self._connect()
+                logger.info("Consuming %s from queue %s", ROUTING_KEY, self.queue)
+                self.drain(channel)
+            except Exception as exc:  # pragma: no cover - broker/network failure
+                logger.error("order.created consumer failed, reconnecting: %s", exc)
+                self._stop.wait(5)
+            finally:
+                if channel is not None:
+                    try:
+                        channel.connection.close()
+                    except Exception:
+                        pass
+
+    # -- consuming ----------------------------------------------------------
+
+    def drain(self, channel) -> None:
+        """Consume from `channel` until stopped (or the stand-in's stream ends)."""
+        batch: List[Delivery] = []
+        for method, properties, body in channel.consume(self.queue, inactivity_timeout=self.flush_interval):
+            if method is not None:
+                batch.append(Delivery(
+                    method.delivery_tag,
+                    getattr(properties, "message_id", None),
+                    body,
+                    getattr(properties, "headers", None),
+                ))
+            if batch and (method is None or len(batch) >= self.batch_size):
+                self.flush(channel, batch)
+                batch = []
+            if self._stop.is_set():
+                break
+        if batch:
+            self.flush(channel, batch)
+        channel.cancel()
+
+    def _remember(self, key: str) -> None:
+        self._seen[key] = None
+        self._seen.move_to_end(key)
+        while len(self._seen) > self.dedupe_size:
+            self._seen.popitem(last=False)
+
+    def _forget(self, keys: List[str]) -> None:
+        for key in keys:
+            self._seen.pop(key, None)
+
+    def _process(self, event: dict, items: Dict[str, int], headers: Optional[dict] = None) -> Tuple[str, Optional[dict], Optional[dict]]:
+        """Apply one order as a continuation of the producer's trace.
+
+        Returns ("ack"|"duplicate"|"requeue", inventory.updated event or None, trace headers for that event).
+        """
+        order_id = event.get("orderId")
+        with span("consume order.created", parent=(headers or {}).get(TRACEPARENT), order_id=order_id):
+            set_correlation_id(event.get("correlationId", order_id))
+            action, updated = self._apply(event, items, order_id)
+            return action, updated, inject()
+
+    def _apply(self, event: dict, items: Dict[str, int], order_id: Optional[str]) -> Tuple[str, Optional[dict]]:
+        if not items:
+            return "ack", None
+        reason = None
+        try:
+            result = self.store.apply(items, order_id=order_id)
+            if result.get("status") == "duplicate":
+                return "duplicate", None
+            status = "inventory.updated"
+        except OutOfStockError:
+            status, reason = "inventory.failed", "out_of_stock"
+        except InvalidRequestError as exc:
+            logger.warning("Failing order %s the store cannot apply: %s", order_id, exc)
+            status, reason = "inventory.failed", "invalid_order"
+        except InventoryStoreError as exc:
+            logger.error("Inventory store failure for order %s: %s", order_id, exc)
+            return "requeue", None
+        updated = {
+            "order_id": order_id,
+            "status": status,
+            "items": [{"sku": sku, "qty": qty} for sku, qty in items.items()],
+            "correlationId": event.get("correlationId", order_id),
+        }
+        if reason is not None:
+            updated["reason"] = reason
+        return "ack", updated
+
+    def flush(self, channel, batch: List[Delivery]) -> None:
+        acks: List[int] = []
+        requeue: List[int] = []
+        reject: List[int] = []
+        pending: List[Tuple[Delivery, List[str], dict, Dict[str, int]]] = []
+
+        for delivery in batch:
+            try:
+                event = json.loads(delivery.body)
+                if not isinstance(event, dict):
+                    raise ValueError("event is not an object")
+                items = order_items(event)
+            except ValueError as exc:
+                logger.warning("Rejecting malformed order.created message %s: %s", delivery.tag, exc)
+                reject.append(delivery.tag)
+                continue
+            keys = [key for key in (delivery.message_id or event.get("messageId"), event.get("orderId")) if key]
+            if any(key in self._seen for key in keys):
+                self._counters["duplicates"] += 1
+                acks.append(delivery.tag)
+                continue
+            # Remembered now so a copy later in this batch is a duplicate; forgotten again
+            # below unless the order is acked.
+            for key in keys:
+                self._remember(key)
+            pending.append((delivery, keys, event, items))
+
+        futures = [
+            (delivery, keys, self._pool.submit(self._process, event, items, delivery.headers))
+            for delivery, keys, event, items in pending
+        ]
+        for delivery, keys, future in futures:
+            try:
+                action, updated, trace_headers = future.result()
+            except Exception as exc:
+                logger.error("Unexpected failure applying order.created message %s: %s", delivery.tag, exc, exc_info=True)
+                action, updated, trace_headers = "requeue", None, None
+            if action == "requeue":
+                # Let the redelivery through the de-duplication check.
+                self._forget(keys)
+                requeue.append(delivery.tag)
+                continue
+            acks.append(delivery.tag)
+            if action == "duplicate":
+                # Already applied by another consumer (the store keeps the order id).
+                self._counters["duplicates"] += 1
+                continue
+            self._counters["orders"] += 1
+            if updated is not None:
+                if updated.get("reason") in ("out_of_stock", "invalid_order"):
+                    self._counters[updated["reason"]] += 1
+                if self.publish:
+                    channel.basic_publish(
+                        exchange="",
+                        routing_key=UPDATED_QUEUE,
+                        body=json.dumps(updated),
+                        properties=_properties(updated, trace_headers),
+                    )
+
+        if requeue:
+            # Requeued messages come straight back, so hold them (and the consumer)
+            # for a growing delay while the store keeps failing.
+            delay = min(self.requeue_backoff_max, self.requeue_backoff * (2 ** self._requeue_streak))
+            self._requeue_streak += 1
+            logger.warning("Requeueing %d order(s) in %.1fs", len(requeue), delay)
+            self._stop.wait(delay)
+        else:
+            self._requeue_streak = 0
+
+        if not requeue and not reject:
+            channel.basic_ack(delivery_tag=max(acks), multiple=True)
+        else:
+            for tag in acks:
+                channel.basic_ack(delivery_tag=tag)
+            for tag in requeue:
+                channel.basic_nack(delivery_tag=tag, requeue=True)
+            for tag in reject:
+                channel.basic_nack(delivery_tag=tag, requeue=False)
+        self._counters["batches"] += 1
+        self._counters["requeued"] += len(requeue)
+        self._counters["rejected"] += len(reject)
+
+
+def _properties(event: dict, headers: Optional[dict] = None):
+    try:
+        import pika  # type: ignore
+    except Exception:  # stand-in brokers accept None
+        return None
+    return pika.BasicProperties(
+        content_type="application/json",
+        delivery_mode=2,
+        correlation_id=event.get("correlationId"),
+        headers=headers or None,
+    )
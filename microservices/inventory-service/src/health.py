@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+logger = logging.getLogger("inventory-service")
+
+
+class HealthMonitor:
+    """Run a backend check on a background thread and serve the cached result.
+
+    Probes only read `status()`, so their latency stays constant however slow
+    the backend is, and N replicas cost one check per `interval` each instead of
+    one per kubelet probe. A result older than `max_age` (the check is hung)
+    counts as a failure. Until `start()` is called, `status()` checks inline.
+    """
+
+    def __init__(self, check: Callable[[], object], interval: float = 5.0, max_age: Optional[float] = None):
+        self.check = check
+        self.interval = interval
+        self.max_age = max_age if max_age is not None else max(3 * interval, 10.0)
+        self._result: Optional[Dict[str, object]] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> Dict[str, object]:
+        started = time.monotonic()
+        try:
+            if self.check() is False:
+                raise RuntimeError("check returned False")
+            result: Dict[str, object] = {"ok": True}
+        except Exception as exc:
+            result = {"ok": False, "error": type(exc).__name__}
+        result["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+        with self._lock:
+            previous = self._result
+            self._result, self._checked_at = result, time.monotonic()
+        if previous is None or previous["ok"] != result["ok"]:
+            log = logger.info if result["ok"] else logger.warning
+            log("Backend health check %s (%s ms)", "passing" if result["ok"] else f"failing: {result['error']}", result["latency_ms"])
+        return result
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        if self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="health-check", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def status(self) -> Dict[str, object]:
+        """Cached result plus its age; never blocks on the backend once started."""
+        if self._thread is None:
+            self.run_once()
+        with self._lock:
+            result, checked_at = self._result, self._checked_at
+        if result is None:
+            return {"ok": False, "error": "pending", "age_seconds": None}
+        age = time.monotonic() - checked_at
+        status = dict(result, age_seconds=round(age, 2))
+        if age > self.max_age:
+            status.update(ok=False, error="stale")
+        return status
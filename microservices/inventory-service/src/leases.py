@@ -0,0 +1,230 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Set
+
+from store import InventoryStore, InventoryStoreError, OutOfStockError
+
+
+logger = logging.getLogger("inventory-service")
+
+
+class _Lease:
+    __slots__ = ("units", "last_used")
+
+    def __init__(self):
+        self.units = 0
+        self.last_used = time.monotonic()
+
+
+class LeasedInventoryStore(InventoryStore):
+    """Serve hot SKUs from blocks of stock leased out of the backing store.
+
+    Leased units are decremented in the backing store when the lease is taken,
+    so the local allocator can only hand out stock that was already removed
+    from the shared counter: overselling is impossible by construction. The
+    cost is that stock held by one pod is invisible to the others until the
+    lease is returned (idle timeout or shutdown).
+    """
+
+    def __init__(
+        self,
+        backing: InventoryStore,
+        skus: Optional[Iterable[str]] = None,
+        block: int = 50,
+        low_watermark: int = 10,
+        idle_timeout: float = 60.0,
+    ):
+        self.backing = backing
+        self.backend = f"{backing.backend}+lease"
+        # None means every SKU is leased.
+        self.skus: Optional[Set[str]] = set(skus) if skus is not None else None
+        self.block = max(1, block)
+        self.low_watermark = max(0, min(low_watermark, self.block))
+        self.idle_timeout = idle_timeout
+        self._leases: Dict[str, _Lease] = {}
+        self._lock = threading.Lock()
+        self._refilling: Set[str] = set()
+        self._refill_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="lease-refill")
+        self._closed = threading.Event()
+        self._reaper = threading.Thread(target=self._reap_idle, name="lease-reaper", daemon=True)
+        self._reaper.start()
+
+    def _is_leased(self, sku: str) -> bool:
+        return self.skus is None or sku in self.skus
+
+    def ping(self) -> None:
+        self.backing.ping()
+
+    # -- local allocator ----------------------------------------------------
+
+    def _take_local(self, items: Dict[str, int]) -> Dict[str, int]:
+        """Take every item from local leases, or nothing. Returns the shortfall per SKU."""
+        with self._lock:
+            short = {}
+            for sku, qty in items.items():
+                lease = self._leases.get(sku)
+                held = lease.units if lease else 0
+                if held < qty:
+                    short[sku] = qty - held
+            if short:
+                return short
+            now = time.monotonic()
+            for sku, qty in items.items():
+                lease = self._leases[sku]
+                lease.units -= qty
+                lease.last_used = now
+            return {}
+
+    def _give_local(self, items: Dict[str, int]) -> None:
+        with self._lock:
+            for sku, qty in items.items():
+                self._leases.setdefault(sku, _Lease()).units += qty
+
+    # -- lease traffic with the backing store ---------------------------------
+
+    def _acquire(self, sku: str, want: int, minimum: int) -> int:
+        """Lease up to `want` units of `sku` (at least `minimum`) from the backing store."""
+        amount = want
+        for _ in range(3):
+            try:
+                self.backing.apply({sku: amount})
+            except OutOfStockError:
+                available = self.backing.get_stock(sku)
+                if available < max(1, minimum):
+                    return 0
+                amount = min(want, available)
+                continue
+            self._give_local({sku: amount})
+            logger.debug("Leased %d units of %s", amount, sku)
+            return amount
+        return 0
+
+    def _refill(self, sku: str) -> None:
+        try:
+            with self._lock:
+                lease = self._leases.get(sku)
+                held = lease.units if lease else 0
+            if held < self.low_watermark and not self._closed.is_set():
+                self._acquire(sku, self.block - held, 1)
+        except InventoryStoreError as exc:
+            logger.warning("Background lease refill for %s failed: %s", sku, exc)
+        finally:
+            with self._lock:
+                self._refilling.discard(sku)
+
+    def _schedule_refills(self, skus: Iterable[str]) -> None:
+        if self._closed.is_set():
+            return
+        with self._lock:
+            due = [
+                sku for sku in skus
+                if sku not in self._refilling
+                and (self._leases[sku].units if sku in self._leases else 0) < self.low_watermark
+            ]
+            self._refilling.update(due)
+        for sku in due:
+            self._refill_pool.submit(self._refill, sku)
+
+    def _return(self, skus: Optional[Iterable[str]] = None) -> None:
+        with self._lock:
+            targets = list(self._leases) if skus is None else [sku for sku in skus if sku in self._leases]
+            returning = {}
+            for sku in targets:
+                lease = self._leases.pop(sku)
+                if lease.units > 0:
+                    returning[sku] = lease.units
+        for sku, units in returning.items():
+            try:
+                self.backing.release({sku: units})
+                logger.info("Returned %d leased units of %s", units, sku)
+            except InventoryStoreError as exc:
+                # Stranded units are under-sold, never over-sold; log them for reconciliation.
+                logger.error("Failed to return %d leased units of %s: %s", units, sku, exc)
+
+    def _reap_idle(self) -> None:
+        interval = max(1.0, min(self.idle_timeout / 2, 15.0))
+        while not self._closed.wait(interval):
+            cutoff = time.monotonic() - self.idle_timeout
+            with self._lock:
+                idle = [
+                    sku for sku, lease in self._leases.items()
+                    if lease.last_used < cutoff and sku not in self._refilling
+                ]
+            if idle:
+                self._return(idle)
+
+    # -- InventoryStore -----------------------------------------------------
+
+    def apply(self, items: Dict[str, int], order_id: Optional[str] = None) -> Dict[str, object]:
+        leased = {sku: qty for sku, qty in items.items() if qty > 0 and self._is_leased(sku)}
+        direct = {sku: qty for sku, qty in items.items() if qty > 0 and not self._is_leased(sku)}
+        if not leased and not direct and order_id is None:
+            return {"status": "noop"}
+
+        if leased:
+            short = self._take_local(leased)
+            for _ in range(3):
+                if not short:
+                    break
+                # Cold or drained lease: refill synchronously, at least the shortfall.
+                for sku, missing in short.items():
+                    if not self._acquire(sku, max(self.block, missing), missing):
+                        raise OutOfStockError(f"insufficient stock for {sku}")
+                short = self._take_local(leased)
+            if short:
+                raise OutOfStockError("insufficient leased stock")
+
+        result: Dict[str, object] = {"status": "updated", "backend": self.backend}
+        # The order id is recorded in the backing store together with the direct
+        # SKUs (alone if there are none), so a duplicate hands the leased units back.
+        if direct or order_id is not None:
+            try:
+                result = dict(self.backing.apply(direct, order_id=order_id), backend=self.backend)
+            except InventoryStoreError:
+                self._give_local(leased)
+                raise
+            if result["status"] == "duplicate":
+                self._give_local(leased)
+                return result
+
+        self._schedule_refills(leased)
+        result["leased"] = sorted(leased)
+        return result
+
+    def release(self, items: Dict[str, int]) -> Dict[str, object]:
+        leased = {sku: qty for sku, qty in items.items() if qty > 0 and self._is_leased(sku)}
+        direct = {sku: qty for sku, qty in items.items() if qty > 0 and not self._is_leased(sku)}
+        self._give_local(leased)
+        if direct:
+            self.backing.release(direct)
+        return {"status": "released", "backend": self.backend}
+
+    def restock(self, items: Dict[str, int], relative: bool = False) -> Dict[str, object]:
+        return dict(self.backing.restock(items, relative=relative), backend=self.backend)
+
+    def get_stock(self, sku: str) -> int:
+        with self._lock:
+            lease = self._leases.get(sku)
+            held = lease.units if lease else 0
+        return self.backing.get_stock(sku) + held
+
+    def reserve(self, hold_id: str, items: Dict[str, int], ttl: float) -> Dict[str, object]:
+        # Holds must be visible to every replica's sweeper, so they bypass the local leases.
+        return dict(self.backing.reserve(hold_id, items, ttl), backend=self.backend)
+
+    def confirm(self, hold_id: str) -> Dict[str, object]:
+        return self.backing.confirm(hold_id)
+
+    def release_hold(self, hold_id: str) -> Dict[str, object]:
+        return self.backing.release_hold(hold_id)
+
+    def expire_holds(self, limit: int = 100) -> int:
+        return self.backing.expire_holds(limit)
+
+    def close(self) -> None:
+        self._closed.set()
+        self._refill_pool.shutdown(wait=True)
+        self._return()
+        self.backing.close()
@@ -0,0 +1,84 @@
+"""Stream a CSV or NDJSON stock file into the DynamoDB inventory table.
+
+Usage (from microservices/inventory-service):
+
+    python src/load_stock.py catalog-stock.csv                 # absolute stock levels
+    python src/load_stock.py restock.ndjson --mode add         # relative increments
+    python src/load_stock.py - --format csv < stock.csv        # read from stdin
+    python src/load_stock.py catalog-stock.csv --sharding      # table has sharded SKUs
+
+CSV rows are `sku,stock` (header optional); NDJSON objects are
+`{"sku": "...", "stock": N}` (or `qty`). Absolute loads use BatchWriteItem,
+increments use UpdateItem ADD; both run across `--workers` threads.
+
+With `--sharding` (for tables where hot SKUs have been resharded) each batch's
+layout is read first and absolute levels are written as conditional
+TransactWriteItems instead, so sharded SKUs keep their shards. Layouts are not
+cached, so memory use stays independent of file size either way.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from dotenv import load_dotenv, find_dotenv
+
+from bulkload import FORMATS, StockFileError, detect_format, iter_records, parallel_load
+from store import DynamoInventoryStore, InventoryStoreError, open_table
+
+
+def main(argv=None) -> int:
+    load_dotenv(find_dotenv())
+    logging.basicConfig(level=logging.INFO, format="[inventory-service] %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Bulk load stock into DynamoDB")
+    parser.add_argument("file", help="stock file path, or - for stdin")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to the file extension (csv unless .ndjson/.jsonl/.json)")
+    parser.add_argument("--mode", choices=("set", "add"), default="set")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INVENTORY_LOAD_WORKERS", "16")))
+    parser.add_argument("--batch-size", type=int, default=100, help="SKUs per restock call (split into 25-item BatchWriteItem requests)")
+    parser.add_argument("--table", default=os.getenv("DDB_TABLE", ""))
+    parser.add_argument("--region", default=os.getenv("AWS_REGION") or os.getenv("AWS_DEFAULT_REGION"))
+    parser.add_argument("--endpoint-url", default=os.getenv("DDB_ENDPOINT_URL"))
+    parser.add_argument(
+        "--sharding",
+        action="store_true",
+        default=os.getenv("INVENTORY_SHARDING", "0").lower() in ("1", "true", "yes", "on"),
+        help="check each SKU's shard layout so sharded SKUs keep their shards (slower; default INVENTORY_SHARDING)",
+    )
+    args = parser.parse_args(argv)
+
+    if not args.table:
+        parser.error("--table or DDB_TABLE is required")
+
+    fmt = args.format or detect_format(args.file)
+    table = open_table(args.table, args.region, args.endpoint_url, max_pool_connections=args.workers)
+    # Each SKU's layout is read once per load, so caching it would only hold memory.
+    store = DynamoInventoryStore(table, sharding=args.sharding, shard_cache_size=0)
+
+    def report(stats):
+        print(f"[inventory-service] loaded {stats.records} SKUs ({stats.as_dict()['records_per_sec']}/s)", file=sys.stderr)
+
+    stream = sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+    try:
+        stats = parallel_load(
+            store,
+            iter_records(stream, fmt),
+            relative=args.mode == "add",
+            batch_size=args.batch_size,
+            workers=args.workers,
+            progress=report,
+        )
+    except (StockFileError, InventoryStoreError) as exc:
+        print(f"[inventory-service] load failed: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+    print(json.dumps(dict(stats.as_dict(), mode=args.mode, format=fmt, table=args.table)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
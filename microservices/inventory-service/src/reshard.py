@@ -0,0 +1,46 @@
+"""Reshard a SKU's stock counter online.
+
+Usage (from microservices/inventory-service):
+
+    python src/reshard.py BOOK-001 --shards 8   # split into 8 shard items
+    python src/reshard.py BOOK-001 --shards 0   # collapse back to a single item
+    python src/reshard.py BOOK-001              # show the current layout
+"""
+import argparse
+import json
+import os
+import sys
+
+from dotenv import load_dotenv, find_dotenv
+
+from store import MAX_SHARDS, DynamoInventoryStore, InventoryStoreError, open_table
+
+
+def main(argv=None) -> int:
+    load_dotenv(find_dotenv())
+    parser = argparse.ArgumentParser(description="Reshard an inventory SKU in DynamoDB")
+    parser.add_argument("sku")
+    parser.add_argument("--shards", type=int, help=f"target shard count (0-{MAX_SHARDS}); omit to only show the layout")
+    parser.add_argument("--table", default=os.getenv("DDB_TABLE", ""))
+    parser.add_argument("--region", default=os.getenv("AWS_REGION") or os.getenv("AWS_DEFAULT_REGION"))
+    parser.add_argument("--endpoint-url", default=os.getenv("DDB_ENDPOINT_URL"))
+    args = parser.parse_args(argv)
+
+    if not args.table:
+        parser.error("--table or DDB_TABLE is required")
+
+    store = DynamoInventoryStore(open_table(args.table, args.region, args.endpoint_url), sharding=True)
+    try:
+        if args.shards is None:
+            result = store.layout(args.sku)
+        else:
+            result = store.reshard(args.sku, args.shards)
+    except (InventoryStoreError, ValueError) as exc:
+        print(f"[inventory-service] reshard failed: {exc}", file=sys.stderr)
+        return 1
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from tracing import set_attribute, traced
+
+try:
+    from botocore.exceptions import BotoCoreError, ClientError  # type: ignore
+    from botocore.exceptions import ConnectionError as BotoConnectionError  # type: ignore
+    from botocore.exceptions import HTTPClientError  # type: ignore
+
+    # Endpoint unreachable, connection reset/closed, connect and read timeouts.
+    NETWORK_ERRORS = (BotoConnectionError, HTTPClientError)
+except Exception:  # pragma: no cover - boto3 always available in cluster image
+    BotoCoreError = ClientError = Exception
+    NETWORK_ERRORS = ()
+
+
+# Errors that mean "try again later" rather than "this request is wrong".
+THROTTLE_CODES = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+}
+TRANSIENT_CODES = THROTTLE_CODES | {
+    "TransactionConflictException",
+    "TransactionInProgressException",
+    "InternalServerError",
+    "ServiceUnavailable",
+}
+# Per-item cancellation reasons of a TransactionCanceledException that are worth retrying.
+TRANSIENT_CANCELLATIONS = {"None", "TransactionConflict", "ThrottlingError", "ProvisionedThroughputExceeded"}
+THROTTLE_CANCELLATIONS = {"ThrottlingError", "ProvisionedThroughputExceeded"}
+
+_deadline: ContextVar[Optional[float]] = ContextVar("dynamodb_deadline", default=None)
+
+
+class DeadlineExceededError(BotoCoreError):
+    """Raised when the request deadline leaves no time for another DynamoDB attempt."""
+
+    fmt = "DynamoDB request deadline exceeded after {attempts} attempt(s)"
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Bound every DynamoDB call made inside the block (retries included) to `seconds`."""
+    token = _deadline.set(time.monotonic() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def classify(exc: Exception) -> Optional[str]:
+    """Return "throttle", "transient" or None (not retryable) for a botocore error.
+
+    botocore's own retries are off (see open_table), so the network errors it
+    would have retried are transient here too.
+    """
+    if isinstance(exc, DeadlineExceededError):
+        return None
+    if NETWORK_ERRORS and isinstance(exc, NETWORK_ERRORS):
+        return "transient"
+    if not isinstance(exc, ClientError):
+        return None
+    error = exc.response.get("Error", {})
+    code = error.get("Code")
+    if code in THROTTLE_CODES:
+        return "throttle"
+    if code in TRANSIENT_CODES:
+        return "transient"
+    if code == "TransactionCanceledException":
+        reasons = {reason.get("Code", "None") for reason in exc.response.get("CancellationReasons") or []}
+        if reasons and reasons <= TRANSIENT_CANCELLATIONS and reasons != {"None"}:
+            return "throttle" if reasons & THROTTLE_CANCELLATIONS else "transient"
+    return None
+
+
+class AdaptiveRateLimiter:
+    """Client-side token bucket that only engages once DynamoDB starts throttling.
+
+    Unlimited until the first throttle; then the rate drops to a fraction of
+    the observed request rate (multiplicative decrease, at most once per
+    `cooldown`) and creeps back up by `increase` requests/s for every second
+    of successful calls (additive increase, independent of the call rate).
+    When the allowed rate is comfortably above demand again the limiter
+    switches itself off.
+    """
+
+    def __init__(self, min_rate: float = 5.0, decrease: float = 0.7, increase: float = 5.0, cooldown: float = 0.2):
+        self.min_rate = min_rate
+        self.decrease = decrease
+        self.increase = increase
+        self.cooldown = cooldown
+        self.rate: Optional[float] = None
+        self._tokens = 0.0
+        self._last_refill = time.monotonic()
+        self._last_decrease = 0.0
+        self._last_increase = 0.0
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._measured = 0.0
+        self._lock = threading.Lock()
+
+    def _observe(self, now: float) -> None:
+        self._window_count += 1
+        elapsed = now - self._window_start
+        if elapsed >= 1.0:
+            self._measured = self._window_count / elapsed
+            self._window_start = now
+            self._window_count = 0
+
+    def acquire(self, until: Optional[float]) -> bool:
+        """Take one token, waiting at most until `until` (monotonic); False if that is not possible."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self.rate is None:
+                    self._observe(now)
+                    return True
+                self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    self._observe(now)
+                    return True
+                wait = (1.0 - self._tokens) / self.rate
+            if until is not None and now + wait > until:
+                return False
+            time.sleep(wait)
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_decrease < self.cooldown:
+                return
+            self._last_decrease = now
+            if self.rate is not None:
+                current = self.rate
+            else:
+                # Demand so far: last full window, or the partial one if that is all we have.
+                partial = self._window_count / max(now - self._window_start, 0.05)
+                current = max(self._measured, partial, self.min_rate)
+            self.rate = max(self.min_rate, current * self.decrease)
+            self._tokens = min(self._tokens, 1.0)
+            self._last_refill = now
+            self._last_increase = now
+
+    def on_success(self) -> None:
+        with self._lock:
+            if self.rate is None:
+                return
+            now = time.monotonic()
+            # At most a second's worth per step, so a success after an idle spell is not a jump.
+            self.rate += self.increase * min(now - self._last_increase, 1.0)
+            self._last_increase = now
+            if self._measured and self.rate > 2 * self._measured:
+                self.rate = None
+
+
+class RetryingClient:
+    """Wrap a botocore DynamoDB client with jittered backoff, rate limiting and a deadline.
+
+    Every API method (`transact_write_items`, `batch_get_item`, ...) goes
+    through `_call`; other attributes pass straight through. Non-retryable
+    errors are raised untouched so callers keep their existing handling.
+    """
+
+    def __init__(
+        self,
+        client,
+        max_attempts: int = 5,
+        base_delay: float = 0.025,
+        max_delay: float = 1.0,
+        default_deadline: Optional[float] = 10.0,
+        limiter: Optional[AdaptiveRateLimiter] = None,
+    ):
+        self._client = client
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.default_deadline = default_deadline
+        self.limiter = limiter if limiter is not None else AdaptiveRateLimiter()
+        self._counters: Dict[str, int] = {"calls": 0, "retries": 0, "throttles": 0, "deadline_exceeded": 0}
+        self._counters_lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict[str, object]:
+        with self._counters_lock:
+            counters: Dict[str, object] = dict(self._counters)
+        counters["rate_limit"] = self.limiter.rate
+        return counters
+
+    def _call(self, operation: str, kwargs: dict):
+        until = _deadline.get()
+        if until is None and self.default_deadline:
+            until = time.monotonic() + self.default_deadline
+        method = getattr(self._client, operation)
+        self._count("calls")
+
+        for attempt in range(1, self.max_attempts + 1):
+            if not self.limiter.acquire(until):
+                self._count("deadline_exceeded")
+                raise DeadlineExceededError(attempts=attempt - 1)
+            try:
+                result = method(**kwargs)
+            except (ClientError, BotoCoreError) as exc:
+                kind = classify(exc)
+                if kind is None:
+                    raise
+                if kind == "throttle":
+                    self._count("throttles")
+                    self.limiter.on_throttle()
+                # Full jitter: spreads retries from many clients instead of synchronising them.
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+                if attempt == self.max_attempts or (until is not None and time.monotonic() + delay >= until):
+                    if until is not None and time.monotonic() + delay >= until:
+                        self._count("deadline_exceeded")
+                    raise
+                self._count("retries")
+                set_attribute("retries", attempt)
+                time.sleep(delay)
+                continue
+            self.limiter.on_success()
+            return result
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if name.startswith("_") or not callable(attr) or name not in self._client.meta.method_to_api_mapping:
+            return attr
+
+        # One span per API call, retries and rate-limit waits included.
+        @traced(f"dynamodb.{name}")
+        def call(**kwargs):
+            return self._call(name, kwargs)
+
+        call.__name__ = name
+        return call
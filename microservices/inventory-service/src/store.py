@@ -0,0 +1,1082 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext, suppress
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from botocore.exceptions import BotoCoreError, ClientError  # type: ignore
+except Exception:  # pragma: no cover - boto3 always available in cluster image
+    BotoCoreError = ClientError = Exception
+
+from metrics import counter, histogram
+from retry import RetryingClient
+
+
+logger = logging.getLogger("inventory-service")
+
+DESCRIBE_WARNING_EMITTED = False
+
+# Shard items live next to the base item in the same table, keyed "<sku>#shard#<n>".
+# A sharded SKU keeps its base item with `stock = 0` and `shards = N`.
+SHARD_SEPARATOR = "#shard#"
+# Resharding rewrites the base item and every old/new shard in one transaction,
+# so 1 + MAX_SHARDS must stay within the 25 items the original layout assumed.
+MAX_SHARDS = 24
+TRANSACT_MAX_ITEMS = 100
+APPLY_ATTEMPTS = 4
+BATCH_WRITE_MAX_ITEMS = 25
+# Holds are items keyed "hold#<id>" in the inventory table. Only holds carry
+# `hold_bucket`/`expires_at`, so the GSI below is a sparse expiry-ordered index;
+# spreading holds over buckets keeps the index partitions cool.
+HOLD_PREFIX = "hold#"
+HOLD_INDEX = "holds-by-expiry"
+# An apply with an order id also writes "order#<id>" in the same transaction,
+# so a redelivered order is recognised by every replica.
+ORDER_PREFIX = "order#"
+BATCH_WRITE_ATTEMPTS = 8
+
+APPLY_SECONDS = histogram(
+    "inventory_dynamodb_apply_seconds",
+    "DynamoInventoryStore.apply latency (retries and shard re-planning included) by outcome.",
+    ("outcome",),
+)
+CONSUMED_CAPACITY = counter(
+    "inventory_dynamodb_consumed_capacity_units_total",
+    "Capacity units consumed by inventory write transactions.",
+    ("table",),
+)
+
+
+class InventoryStoreError(Exception):
+    """Base exception for inventory store failures."""
+
+
+class InvalidRequestError(InventoryStoreError):
+    """The request can never succeed as given (e.g. too many SKUs); retrying will not help."""
+
+
+class OutOfStockError(InventoryStoreError):
+    """Raised when requested quantity exceeds available stock."""
+
+
+class HoldNotFoundError(InventoryStoreError):
+    """Raised when a hold does not exist, has expired or was already settled."""
+
+
+class InventoryStore:  # pragma: no cover - interface definition
+    backend: str = "unknown"
+
+    def ping(self) -> None:
+        raise NotImplementedError
+
+    def apply(self, items: Dict[str, int], order_id: Optional[str] = None) -> Dict[str, object]:
+        """Decrement `items` atomically; with `order_id`, repeating an applied order is a no-op ("duplicate")."""
+        raise NotImplementedError
+
+    def release(self, items: Dict[str, int]) -> Dict[str, object]:
+        """Return previously applied units to stock."""
+        raise NotImplementedError
+
+    def restock(self, items: Dict[str, int], relative: bool = False) -> Dict[str, object]:
+        """Set stock to the given levels, or add to current stock when `relative`."""
+        raise NotImplementedError
+
+    def get_stock(self, sku: str) -> int:
+        raise NotImplementedError
+
+    def reserve(self, hold_id: str, items: Dict[str, int], ttl: float) -> Dict[str, object]:
+        """Take `items` out of stock under `hold_id` until confirmed, released or expired."""
+        raise NotImplementedError
+
+    def confirm(self, hold_id: str) -> Dict[str, object]:
+        """Make a hold permanent (the stock stays decremented)."""
+        raise NotImplementedError
+
+    def release_hold(self, hold_id: str) -> Dict[str, object]:
+        """Return a hold's units to stock."""
+        raise NotImplementedError
+
+    def expire_holds(self, limit: int = 100) -> int:
+        """Release up to `limit` expired holds; returns how many were released."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        return
+
+
+class InMemoryInventoryStore(InventoryStore):
+    """Process-local stock counters, safe for FastAPI's threadpool.
+
+    SKUs hash onto a fixed set of lock stripes; multi-SKU operations take their
+    stripes in index order so concurrent orders cannot deadlock. When
+    `snapshot_path` is set the counters are reloaded from it at startup and
+    written back every `snapshot_interval` seconds (and on close).
+    """
+
+    backend = "memory"
+
+    def __init__(self, stripes: int = 64, snapshot_path: Optional[str] = None, snapshot_interval: float = 0.0):
+        self._data: Dict[str, int] = {}
+        self._stripes = [threading.Lock() for _ in range(max(1, stripes))]
+        # hold_id -> (items, expires_at as epoch seconds); the heap orders expiries
+        # and may contain entries for holds that were settled since (skipped lazily).
+        self._holds: Dict[str, Tuple[Dict[str, int], float]] = {}
+        self._hold_expiry: List[Tuple[float, str]] = []
+        self._holds_lock = threading.Lock()
+        # Ids of orders applied with an order id, guarded by the holds lock.
+        self._orders: Set[str] = set()
+        self._version = 0
+        self._snapshot_version = 0
+        self.snapshot_path = snapshot_path
+        self._closed = threading.Event()
+        self._snapshotter: Optional[threading.Thread] = None
+        if snapshot_path:
+            self._load_snapshot()
+            if snapshot_interval > 0:
+                self._snapshotter = threading.Thread(
+                    target=self._snapshot_loop, args=(snapshot_interval,), name="inventory-snapshot", daemon=True
+                )
+                self._snapshotter.start()
+
+    @contextmanager
+    def _locked(self, skus: Iterable[str]):
+        indexes = sorted({hash(sku) % len(self._stripes) for sku in skus})
+        for index in indexes:
+            self._stripes[index].acquire()
+        try:
+            yield
+        finally:
+            for index in reversed(indexes):
+                self._stripes[index].release()
+
+    def ping(self) -> None:
+        return
+
+    def apply(self, items: Dict[str, int], order_id: Optional[str] = None) -> Dict[str, object]:
+        # Only an apply with an order id takes the holds lock, to check and record the id.
+        with self._locked(items), (self._holds_lock if order_id is not None else nullcontext()):
+            if order_id is not None and order_id in self._orders:
+                return {"status": "duplicate", "backend": self.backend}
+            for sku, qty in items.items():
+                available = self._data.get(sku, 0)
+                if available < qty:
+                    raise OutOfStockError(f"insufficient stock for {sku}")
+            for sku, qty in items.items():
+                self._data[sku] = self._data.get(sku, 0) - qty
+            if order_id is not None:
+                self._orders.add(order_id)
+            self._version += 1
+        return {"status": "updated", "backend": self.backend}
+
+    def release(self, items: Dict[str, int]) -> Dict[str, object]:
+        with self._locked(items):
+            for sku, qty in items.items():
+                if qty > 0:
+                    self._data[sku] = self._data.get(sku, 0) + qty
+            self._version += 1
+        return {"status": "released", "backend": self.backend}
+
+    def restock(self, items: Dict[str, int], relative: bool = False) -> Dict[str, object]:
+        if any(qty < 0 for qty in items.values()):
+            raise InventoryStoreError("restock quantities must be non-negative")
+        with self._locked(items):
+            for sku, qty in items.items():
+                self._data[sku] = self._data.get(sku, 0) + qty if relative else qty
+            self._version += 1
+        return {"status": "restocked", "backend": self.backend, "count": len(items)}
+
+    def get_stock(self, sku: str) -> int:
+        return self._data.get(sku, 0)
+
+    # -- holds --------------------------------------------------------------
+    # Lock order is stripes -> holds lock, so a snapshot never sees a hold
+    # without its stock movement or the other way round.
+
+    def reserve(self, hold_id: str, items: Dict[str, int], ttl: float) -> Dict[str, object]:
+        wanted = {sku: qty for sku, qty in items.items() if qty > 0}
+        if not wanted:
+            raise InventoryStoreError("cannot reserve an empty hold")
+        expires_at = time.time() + ttl
+        with self._locked(wanted):
+            # The holds lock spans check-and-insert: two reserves with the same
+            # hold_id but different SKUs take different stripes.
+            with self._holds_lock:
+                existing = self._holds.get(hold_id)
+                if existing is not None:
+                    return {"status": "held", "hold_id": hold_id, "expires_at": existing[1], "duplicate": True}
+                for sku, qty in wanted.items():
+                    if self._data.get(sku, 0) < qty:
+                        raise OutOfStockError(f"insufficient stock for {sku}")
+                for sku, qty in wanted.items():
+                    self._data[sku] -= qty
+                self._holds[hold_id] = (wanted, expires_at)
+                heapq.heappush(self._hold_expiry, (expires_at, hold_id))
+            self._version += 1
+        return {"status": "held", "hold_id": hold_id, "expires_at": expires_at, "backend": self.backend}
+
+    def _settle(self, hold_id: str, restore: bool, expired_only: bool = False) -> Optional[Dict[str, int]]:
+        with self._holds_lock:
+            entry = self._holds.get(hold_id)
+        if entry is None:
+            return None
+        items, expires_at = entry
+        with self._locked(items):
+            with self._holds_lock:
+                if self._holds.get(hold_id) is not entry:
+                    return None
+                if expired_only and expires_at > time.time():
+                    return None
+                del self._holds[hold_id]
+            if restore:
+                for sku, qty in items.items():
+                    self._data[sku] = self._data.get(sku, 0) + qty
+            self._version += 1
+        return items
+
+    def confirm(self, hold_id: str) -> Dict[str, object]:
+        with self._holds_lock:
+            entry = self._holds.get(hold_id)
+        if entry is None:
+            raise HoldNotFoundError(f"hold {hold_id} not found")
+        if entry[1] <= time.time():
+            self._settle(hold_id, restore=True, expired_only=True)
+            raise HoldNotFoundError(f"hold {hold_id} expired")
+        if self._settle(hold_id, restore=False) is None:
+            raise HoldNotFoundError(f"hold {hold_id} not found")
+        return {"status": "confirmed", "hold_id": hold_id, "backend": self.backend}
+
+    def release_hold(self, hold_id: str) -> Dict[str, object]:
+        if self._settle(hold_id, restore=True) is None:
+            raise HoldNotFoundError(f"hold {hold_id} not found")
+        return {"status": "released", "hold_id": hold_id, "backend": self.backend}
+
+    def expire_holds(self, limit: int = 100) -> int:
+        now = time.time()
+        due: List[str] = []
+        with self._holds_lock:
+            while self._hold_expiry and self._hold_expiry[0][0] <= now and len(due) < limit:
+                expires_at, hold_id = heapq.heappop(self._hold_expiry)
+                entry = self._holds.get(hold_id)
+                if entry is not None and entry[1] == expires_at:
+                    due.append(hold_id)
+        return sum(1 for hold_id in due if self._settle(hold_id, restore=True, expired_only=True) is not None)
+
+    # -- snapshots ----------------------------------------------------------
+
+    def _load_snapshot(self) -> None:
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as exc:
+            logger.error("Ignoring unreadable inventory snapshot %s: %s", self.snapshot_path, exc)
+            return
+        self._data = {str(sku): int(qty) for sku, qty in data.get("stock", {}).items()}
+        for hold_id, hold in data.get("holds", {}).items():
+            self._holds[hold_id] = ({str(sku): int(qty) for sku, qty in hold["items"].items()}, float(hold["expires_at"]))
+            self._hold_expiry.append((float(hold["expires_at"]), hold_id))
+        heapq.heapify(self._hold_expiry)
+        self._orders = {str(order_id) for order_id in data.get("orders", [])}
+        logger.info("Loaded %d SKUs and %d holds from snapshot %s", len(self._data), len(self._holds), self.snapshot_path)
+
+    def snapshot(self) -> bool:
+        """Write the counters to `snapshot_path` atomically; returns False if nothing changed."""
+        if not self.snapshot_path:
+            return False
+        for lock in self._stripes:
+            lock.acquire()
+        try:
+            version = self._version
+            if version == self._snapshot_version and os.path.exists(self.snapshot_path):
+                return False
+            data = dict(self._data)
+            with self._holds_lock:
+                holds = {
+                    hold_id: {"items": items, "expires_at": expires_at}
+                    for hold_id, (items, expires_at) in self._holds.items()
+                }
+                orders = sorted(self._orders)
+        finally:
+            for lock in reversed(self._stripes):
+                lock.release()
+
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".inventory-", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump({"version": 1, "stock": data, "holds": holds, "orders": orders}, fh, separators=(",", ":"))
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError:
+            with suppress(OSError):
+                os.unlink(tmp_path)
+            raise
+        self._snapshot_version = version
+        return True
+
+    def _snapshot_loop(self, interval: float) -> None:
+        while not self._closed.wait(interval):
+            try:
+                self.snapshot()
+            except OSError as exc:
+                logger.error("Inventory snapshot to %s failed: %s", self.snapshot_path, exc)
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._snapshotter is not None:
+            self._snapshotter.join(timeout=5)
+        if self.snapshot_path:
+            try:
+                self.snapshot()
+            except OSError as exc:
+                logger.error("Final inventory snapshot to %s failed: %s", self.snapshot_path, exc)
+
+
+def open_table(
+    table_name: str,
+    region: Optional[str],
+    endpoint_url: Optional[str] = None,
+    max_pool_connections: Optional[int] = None,
+):
+    """Return a boto3 Table resource for `table_name`.
+
+    botocore's own retries are disabled: DynamoInventoryStore wraps the client
+    in retry.RetryingClient, and stacking both would multiply attempts.
+    """
+    # boto3 takes a few hundred ms to import; only pay for it once a table is actually opened.
+    try:
+        import boto3  # type: ignore
+        from botocore.config import Config as BotoConfig  # type: ignore
+    except ImportError as exc:
+        raise RuntimeError("boto3 is required for the DynamoDB inventory store") from exc
+    session_kwargs = {}
+    if region:
+        session_kwargs["region_name"] = region
+    session = boto3.session.Session(**session_kwargs)
+    resource_kwargs = {}
+    if endpoint_url:
+        resource_kwargs["endpoint_url"] = endpoint_url
+    config_kwargs = {"retries": {"total_max_attempts": 1}}
+    if max_pool_connections:
+        # One HTTP connection per worker thread; botocore defaults to 10.
+        config_kwargs["max_pool_connections"] = max_pool_connections
+    resource_kwargs["config"] = BotoConfig(**config_kwargs)
+    return session.resource("dynamodb", **resource_kwargs).Table(table_name)
+
+
+def shard_key(sku: str, index: int) -> str:
+    return f"{sku}{SHARD_SEPARATOR}{index}"
+
+
+class _TransactionCancelled(Exception):
+    """Internal signal carrying the per-item cancellation codes of a transaction."""
+
+    def __init__(self, codes: List[str]):
+        super().__init__(codes)
+        self.codes = codes
+
+
+class _ExtraConditionFailed(Exception):
+    """Internal signal: the non-stock item of a transaction failed its condition."""
+
+
+class DynamoInventoryStore(InventoryStore):
+    backend = "dynamodb"
+
+    def __init__(
+        self,
+        table,
+        sharding: bool = False,
+        shard_cache_ttl: float = 30.0,
+        shard_cache_size: int = 10000,
+        hold_buckets: int = 8,
+        client: Optional[RetryingClient] = None,
+    ):
+        self.table = table
+        # Every call goes through the shared retry / rate-limit / deadline layer.
+        self.client = client if client is not None else RetryingClient(table.meta.client)
+        self.sharding = sharding
+        self.shard_cache_ttl = shard_cache_ttl
+        # LRU-bounded so every SKU ever touched does not stay cached; 0 disables the cache.
+        self.shard_cache_size = max(0, shard_cache_size)
+        self._shard_cache: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._shard_cache_lock = threading.Lock()
+        # Round-robin cursor; the random start keeps replicas from hitting shard 0 together.
+        self._cursor = itertools.count(random.randrange(1 << 16))
+        self.hold_buckets = max(1, hold_buckets)
+        self._sweep_pool: Optional[ThreadPoolExecutor] = None
+
+    def ping(self) -> None:
+        global DESCRIBE_WARNING_EMITTED
+        try:
+            self.client.describe_table(TableName=self.table.name)
+        except ClientError as exc:  # pragma: no cover - network/aws failure
+            error = exc.response.get("Error", {})
+            code = error.get("Code")
+            message = error.get("Message", "")
+            if code == "AccessDeniedException" and "dynamodb:DescribeTable" in message:
+                if not DESCRIBE_WARNING_EMITTED:
+                    logger.warning("DescribeTable access denied; skipping table health check")
+                    DESCRIBE_WARNING_EMITTED = True
+                else:
+                    logger.debug("DescribeTable access denied; skipping table health check")
+                return
+            raise InventoryStoreError(f"describe_table failed: {error}") from exc
+        except BotoCoreError as exc:  # pragma: no cover - network/aws failure
+            raise InventoryStoreError(f"dynamodb ping failed: {exc}") from exc
+
+    # -- shard layout -------------------------------------------------------
+
+    def _shard_counts(self, skus: List[str], refresh: bool = False) -> Dict[str, int]:
+        """Return the shard count per SKU (0 means the single-item layout)."""
+        if not self.sharding:
+            return {sku: 0 for sku in skus}
+        now = time.monotonic()
+        counts: Dict[str, int] = {}
+        missing: List[str] = []
+        with self._shard_cache_lock:
+            for sku in skus:
+                cached = None if refresh else self._shard_cache.get(sku)
+                if cached and cached[1] > now:
+                    counts[sku] = cached[0]
+                    self._shard_cache.move_to_end(sku)
+                else:
+                    missing.append(sku)
+        if missing:
+            fetched = self._read_items(missing, ("shards",), consistent=refresh)
+            expires_at = now + self.shard_cache_ttl
+            with self._shard_cache_lock:
+                for sku in missing:
+                    item = fetched.get(sku) or {}
+                    count = int(item.get("shards", {}).get("N", "0"))
+                    counts[sku] = count
+                    if self.shard_cache_size:
+                        self._shard_cache[sku] = (count, expires_at)
+                        self._shard_cache.move_to_end(sku)
+                while len(self._shard_cache) > self.shard_cache_size:
+                    self._shard_cache.popitem(last=False)
+        return counts
+
+    def _invalidate(self, skus: List[str]) -> None:
+        with self._shard_cache_lock:
+            for sku in skus:
+                self._shard_cache.pop(sku, None)
+
+    def _read_items(self, keys: List[str], attributes: Tuple[str, ...], consistent: bool = False) -> Dict[str, dict]:
+        """BatchGetItem wrapper returning raw items keyed by `sku`."""
+        found: Dict[str, dict] = {}
+        names = {f"#a{index}": name for index, name in enumerate(("sku",) + attributes)}
+        for start in range(0, len(keys), 100):
+            request = {
+                self.table.name: {
+                    "Keys": [{"sku": {"S": key}} for key in keys[start:start + 100]],
+                    "ProjectionExpression": ", ".join(names),
+                    "ExpressionAttributeNames": names,
+                    "ConsistentRead": consistent,
+                }
+            }
+            for attempt in range(5):
+                try:
+                    response = self.client.batch_get_item(RequestItems=request)
+                except ClientError as exc:
+                    code = exc.response.get("Error", {}).get("Code")
+                    raise InventoryStoreError(f"dynamodb batch read failed: {code}") from exc
+                except BotoCoreError as exc:
+                    raise InventoryStoreError(f"dynamodb request failed: {exc}") from exc
+                for item in response.get("Responses", {}).get(self.table.name, []):
+                    found[item["sku"]["S"]] = item
+                request = response.get("UnprocessedKeys") or {}
+                if not request:
+                    break
+                time.sleep(0.05 * (2 ** attempt))
+            else:
+                raise InventoryStoreError("dynamodb batch read left unprocessed keys")
+        return found
+
+    def _shard_stocks(self, sku: str, shards: int) -> List[int]:
+        keys = [shard_key(sku, index) for index in range(shards)]
+        items = self._read_items(keys, ("stock",), consistent=True)
+        return [int(items.get(key, {}).get("stock", {}).get("N", "0")) for key in keys]
+
+    def _pick_shard(self, sku: str, shards: int) -> str:
+        if shards <= 0:
+            return sku
+        return shard_key(sku, next(self._cursor) % shards)
+
+    def _plan_split(self, sku: str, qty: int, shards: int) -> List[Tuple[str, int]]:
+        """Spread `qty` over the shards that currently hold stock, preferring a single one."""
+        if shards <= 0:
+            item = self._read_items([sku], ("stock",), consistent=True).get(sku, {})
+            if int(item.get("stock", {}).get("N", "0")) < qty:
+                raise OutOfStockError(f"insufficient stock for {sku}")
+            return [(sku, qty)]
+
+        stocks = self._shard_stocks(sku, shards)
+        if sum(stocks) < qty:
+            raise OutOfStockError(f"insufficient stock for {sku}")
+        offset = next(self._cursor) % shards
+        order = [(offset + step) % shards for step in range(shards)]
+        for index in order:
+            if stocks[index] >= qty:
+                return [(shard_key(sku, index), qty)]
+        plan: List[Tuple[str, int]] = []
+        remaining = qty
+        for index in order:
+            take = min(stocks[index], remaining)
+            if take > 0:
+                plan.append((shard_key(sku, index), take))
+                remaining -= take
+            if remaining == 0:
+                break
+        return plan
+
+    # -- writes -------------------------------------------------------------
+
+    def _transact(self, transact_items: List[dict]) -> dict:
+        try:
+            response = self.client.transact_write_items(
+                TransactItems=transact_items,
+                ReturnConsumedCapacity="TOTAL"
+            )
+        except ClientError as exc:
+            code = exc.response.get("Error", {}).get("Code")
+            if code == "ConditionalCheckFailedException":
+                raise OutOfStockError("requested quantity exceeds available stock") from exc
+            if code == "TransactionCanceledException":
+                reasons = exc.response.get("CancellationReasons") or []
+                raise _TransactionCancelled([reason.get("Code", "None") for reason in reasons]) from exc
+            if code == "ValidationException":
+                raise InvalidRequestError(f"dynamodb rejected the transaction: {code}") from exc
+            raise InventoryStoreError(f"dynamodb transaction failed: {code}") from exc
+        except BotoCoreError as exc:
+            raise InventoryStoreError(f"dynamodb request failed: {exc}") from exc
+        for consumed in response.get("ConsumedCapacity") or []:
+            CONSUMED_CAPACITY.inc(consumed.get("TableName", self.table.name), amount=float(consumed.get("CapacityUnits", 0)))
+        return response
+
+    def _decrement(self, key: str, qty: int, now: str, base: bool) -> dict:
+        condition = "attribute_exists(#stock) AND #stock >= :qty"
+        names = {"#stock": "stock"}
+        if base and self.sharding:
+            # A stale shard cache must not decrement the zeroed base of a sharded SKU.
+            condition += " AND attribute_not_exists(#shards)"
+            names["#shards"] = "shards"
+        return {
+            "Update": {
+                "TableName": self.table.name,
+                "Key": {"sku": {"S": key}},
+                "UpdateExpression": "SET #stock = #stock - :qty, updated_at = :ts",
+                "ConditionExpression": condition,
+                "ExpressionAttributeNames": names,
+                "ExpressionAttributeValues": {
+                    ":qty": {"N": str(qty)},
+                    ":ts": {"S": now},
+                },
+            }
+        }
+
+    def apply(self, items: Dict[str, int], order_id: Optional[str] = None) -> Dict[str, object]:
+        if len(items) > 25:
+            raise InvalidRequestError("DynamoDB transaction limit exceeded (max 25 unique SKUs per order)")
+
+        wanted = {sku: qty for sku, qty in items.items() if qty > 0}
+        if not wanted and order_id is None:
+            return {"status": "noop"}
+        marker = None
+        if order_id is not None:
+            marker = {
+                "Put": {
+                    "TableName": self.table.name,
+                    "Item": {
+                        "sku": {"S": ORDER_PREFIX + order_id},
+                        "applied_at": {"S": datetime.now(timezone.utc).isoformat()},
+                    },
+                    "ConditionExpression": "attribute_not_exists(sku)",
+                }
+            }
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = self._apply(wanted, extra=marker)
+            outcome = "ok"
+        except _ExtraConditionFailed:
+            outcome = "duplicate"
+            return {"status": "duplicate"}
+        except OutOfStockError:
+            outcome = "out_of_stock"
+            raise
+        finally:
+            APPLY_SECONDS.observe(time.perf_counter() - started, outcome)
+        return {
+            "status": "updated",
+            "consumed_capacity": response.get("ConsumedCapacity", []),
+        }
+
+    def _apply(self, wanted: Dict[str, int], extra: Optional[dict] = None) -> dict:
+        """Decrement `wanted` in one transaction, optionally together with an `extra` write.
+
+        A failed condition on `extra` raises `_ExtraConditionFailed`.
+        """
+        layout = self._shard_counts(list(wanted))
+        plan: Dict[str, List[Tuple[str, int]]] = {
+            sku: [(self._pick_shard(sku, layout[sku]), qty)] for sku, qty in wanted.items()
+        }
+
+        for attempt in range(APPLY_ATTEMPTS):
+            now = datetime.now(timezone.utc).isoformat()
+            transact_items = []
+            owners: List[str] = []
+            for sku, parts in plan.items():
+                for key, qty in parts:
+                    transact_items.append(self._decrement(key, qty, now, base=key == sku))
+                    owners.append(sku)
+            if extra is not None:
+                transact_items.append(extra)
+            if len(transact_items) > TRANSACT_MAX_ITEMS:
+                raise InventoryStoreError("DynamoDB transaction limit exceeded while splitting across shards")
+
+            try:
+                return self._transact(transact_items)
+            except _TransactionCancelled as cancelled:
+                if extra is not None and cancelled.codes[len(owners):] == ["ConditionalCheckFailed"]:
+                    raise _ExtraConditionFailed() from cancelled
+                failed = sorted({owners[i] for i, code in enumerate(cancelled.codes[:len(owners)]) if code == "ConditionalCheckFailed"})
+                if not failed:
+                    # Conflicts and throttles were already retried by the RetryingClient.
+                    raise InventoryStoreError(f"dynamodb transaction cancelled: {cancelled.codes}") from cancelled
+                if not self.sharding:
+                    raise OutOfStockError("requested quantity exceeds available stock") from cancelled
+                # The chosen shard ran dry or the layout changed underneath us:
+                # refresh the layout and spread the quantity over shards with stock.
+                self._invalidate(failed)
+                layout.update(self._shard_counts(failed, refresh=True))
+                for sku in failed:
+                    plan[sku] = self._plan_split(sku, wanted[sku], layout[sku])
+                time.sleep(random.uniform(0, 0.01 * (2 ** attempt)))
+
+        raise InventoryStoreError("dynamodb transaction did not succeed after retries")
+
+    def release(self, items: Dict[str, int]) -> Dict[str, object]:
+        wanted = {sku: qty for sku, qty in items.items() if qty > 0}
+        if not wanted:
+            return {"status": "noop"}
+        if len(wanted) > 25:
+            raise InvalidRequestError("DynamoDB transaction limit exceeded (max 25 unique SKUs per release)")
+        self._release(wanted)
+        return {"status": "released"}
+
+    def _release(self, wanted: Dict[str, int], extra: Optional[dict] = None) -> None:
+        """Increment `wanted` in one transaction, optionally together with an `extra` write."""
+        layout = self._shard_counts(list(wanted))
+        for attempt in range(APPLY_ATTEMPTS):
+            now = datetime.now(timezone.utc).isoformat()
+            transact_items = []
+            owners: List[str] = []
+            for sku, qty in wanted.items():
+                key = self._pick_shard(sku, layout[sku])
+                condition = "attribute_exists(#stock)"
+                names = {"#stock": "stock"}
+                if key == sku and self.sharding:
+                    condition += " AND attribute_not_exists(#shards)"
+                    names["#shards"] = "shards"
+                transact_items.append({
+                    "Update": {
+                        "TableName": self.table.name,
+                        "Key": {"sku": {"S": key}},
+                        "UpdateExpression": "SET #stock = #stock + :qty, updated_at = :ts",
+                        "ConditionExpression": condition,
+                        "ExpressionAttributeNames": names,
+                        "ExpressionAttributeValues": {
+                            ":qty": {"N": str(qty)},
+                            ":ts": {"S": now},
+                        },
+                    }
+                })
+                owners.append(sku)
+            if extra is not None:
+                transact_items.append(extra)
+            try:
+                self._transact(transact_items)
+                return
+            except (_TransactionCancelled, OutOfStockError) as exc:
+                codes = getattr(exc, "codes", ["ConditionalCheckFailed"] * len(transact_items))
+                if extra is not None and codes[len(owners):] == ["ConditionalCheckFailed"]:
+                    raise _ExtraConditionFailed() from exc
+                failed = sorted({owners[i] for i, code in enumerate(codes[:len(owners)]) if code == "ConditionalCheckFailed"})
+                if not failed:
+                    raise InventoryStoreError(f"dynamodb transaction cancelled: {codes}") from exc
+                if not self.sharding:
+                    raise InventoryStoreError(f"cannot release stock for unknown skus: {failed}") from exc
+                # A resharded SKU: pick a shard from the fresh layout.
+                self._invalidate(failed)
+                layout.update(self._shard_counts(failed, refresh=True))
+                time.sleep(random.uniform(0, 0.01 * (2 ** attempt)))
+
+        raise InventoryStoreError("dynamodb release did not succeed after retries")
+
+    def _batch_put(self, items: Dict[str, int]) -> None:
+        """Write absolute stock levels with BatchWriteItem, retrying unprocessed items."""
+        now = datetime.now(timezone.utc).isoformat()
+        requests = [
+            {"PutRequest": {"Item": {"sku": {"S": sku}, "stock": {"N": str(qty)}, "updated_at": {"S": now}}}}
+            for sku, qty in items.items()
+        ]
+        for start in range(0, len(requests), BATCH_WRITE_MAX_ITEMS):
+            pending = {self.table.name: requests[start:start + BATCH_WRITE_MAX_ITEMS]}
+            for attempt in range(BATCH_WRITE_ATTEMPTS):
+                try:
+                    response = self.client.batch_write_item(RequestItems=pending)
+                except ClientError as exc:
+                    code = exc.response.get("Error", {}).get("Code")
+                    raise InventoryStoreError(f"dynamodb batch write failed: {code}") from exc
+                except BotoCoreError as exc:
+                    raise InventoryStoreError(f"dynamodb request failed: {exc}") from exc
+                pending = response.get("UnprocessedItems") or {}
+                if not pending:
+                    break
+                time.sleep(random.uniform(0.5, 1.0) * min(2.0, 0.05 * (2 ** attempt)))
+            else:
+                raise InventoryStoreError("dynamodb batch write left unprocessed items")
+
+    def _set_stocks(self, items: Dict[str, int]) -> List[str]:
+        """Set single-item SKUs' stock in TransactWriteItems chunks; return the SKUs found sharded.
+
+        Each SET is conditioned on the SKU not being sharded, so unlike a
+        BatchWriteItem put it never clobbers a SKU resharded since its layout
+        was read, and it leaves the item's other attributes in place.
+        """
+        resharded: List[str] = []
+        pending = list(items.items())
+        for start in range(0, len(pending), TRANSACT_MAX_ITEMS):
+            chunk = dict(pending[start:start + TRANSACT_MAX_ITEMS])
+            while chunk:
+                now = datetime.now(timezone.utc).isoformat()
+                skus = list(chunk)
+                transact_items = [
+                    {
+                        "Update": {
+                            "TableName": self.table.name,
+                            "Key": {"sku": {"S": sku}},
+                            "UpdateExpression": "SET #stock = :qty, updated_at = :ts",
+                            "ConditionExpression": "attribute_not_exists(#shards)",
+                            "ExpressionAttributeNames": {"#stock": "stock", "#shards": "shards"},
+                            "ExpressionAttributeValues": {":qty": {"N": str(chunk[sku])}, ":ts": {"S": now}},
+                        }
+                    }
+                    for sku in skus
+                ]
+                try:
+                    self._transact(transact_items)
+                    break
+                except _TransactionCancelled as cancelled:
+                    failed = [sku for sku, code in zip(skus, cancelled.codes) if code == "ConditionalCheckFailed"]
+                    if not failed:
+                        raise InventoryStoreError(f"dynamodb transaction cancelled: {cancelled.codes}") from cancelled
+                    # The whole chunk was cancelled: retry it without the resharded SKUs.
+                    resharded.extend(failed)
+                    for sku in failed:
+                        del chunk[sku]
+        return resharded
+
+    def _increment(self, sku: str, qty: int) -> bool:
+        """ADD to a single-item SKU (creating it if missing); False if the SKU turned out sharded."""
+        condition = "attribute_not_exists(#shards)" if self.sharding else None
+        kwargs = {
+            "TableName": self.table.name,
+            "Key": {"sku": {"S": sku}},
+            "UpdateExpression": "ADD #stock :qty SET updated_at = :ts",
+            "ExpressionAttributeNames": {"#stock": "stock"},
+            "ExpressionAttributeValues": {
+                ":qty": {"N": str(qty)},
+                ":ts": {"S": datetime.now(timezone.utc).isoformat()},
+            },
+        }
+        if condition:
+            kwargs["ConditionExpression"] = condition
+            kwargs["ExpressionAttributeNames"]["#shards"] = "shards"
+        try:
+            self.client.update_item(**kwargs)
+            return True
+        except ClientError as exc:
+            code = exc.response.get("Error", {}).get("Code")
+            if code == "ConditionalCheckFailedException":
+                return False
+            raise InventoryStoreError(f"dynamodb update failed: {code}") from exc
+        except BotoCoreError as exc:
+            raise InventoryStoreError(f"dynamodb request failed: {exc}") from exc
+
+    def restock(self, items: Dict[str, int], relative: bool = False) -> Dict[str, object]:
+        if any(qty < 0 for qty in items.values()):
+            raise InventoryStoreError("restock quantities must be non-negative")
+        if not items:
+            return {"status": "noop"}
+
+        layout = self._shard_counts(list(items))
+        sharded = {sku: qty for sku, qty in items.items() if layout[sku]}
+        plain = {sku: qty for sku, qty in items.items() if not layout[sku]}
+
+        if relative:
+            for sku, qty in plain.items():
+                if qty and not self._increment(sku, qty):
+                    self._invalidate([sku])
+                    sharded[sku] = qty
+            for sku, qty in sharded.items():
+                if qty:
+                    self.release({sku: qty})
+        else:
+            # BatchWriteItem cannot express conditions, so it is only safe when
+            # no SKU can be sharded. Otherwise the layout read above may be up
+            # to shard_cache_ttl stale: plain SKUs are set conditionally and any
+            # that were resharded meanwhile go through the conditional rewrite
+            # used for resharding, like the SKUs already known to be sharded.
+            if not self.sharding:
+                self._batch_put(plain)
+            else:
+                resharded = self._set_stocks(plain)
+                self._invalidate(resharded)
+                layout.update(self._shard_counts(resharded, refresh=True))
+                sharded.update((sku, plain[sku]) for sku in resharded)
+            for sku, qty in sharded.items():
+                self.reshard(sku, layout[sku], stock=qty)
+        return {"status": "restocked", "backend": self.backend, "count": len(items)}
+
+    # -- holds --------------------------------------------------------------
+
+    def reserve(self, hold_id: str, items: Dict[str, int], ttl: float) -> Dict[str, object]:
+        wanted = {sku: qty for sku, qty in items.items() if qty > 0}
+        if not wanted:
+            raise InventoryStoreError("cannot reserve an empty hold")
+        if len(wanted) > 25:
+            raise InvalidRequestError("DynamoDB transaction limit exceeded (max 25 unique SKUs per hold)")
+
+        expires_at = int(time.time() + ttl)
+        bucket = zlib.crc32(hold_id.encode("utf-8")) % self.hold_buckets
+        hold_item = {
+            "Put": {
+                "TableName": self.table.name,
+                "Item": {
+                    "sku": {"S": HOLD_PREFIX + hold_id},
+                    "lines": {"M": {sku: {"N": str(qty)} for sku, qty in wanted.items()}},
+                    "expires_at": {"N": str(expires_at)},
+                    "hold_bucket": {"S": str(bucket)},
+                    "created_at": {"S": datetime.now(timezone.utc).isoformat()},
+                },
+                "ConditionExpression": "attribute_not_exists(sku)",
+            }
+        }
+        try:
+            self._apply(wanted, extra=hold_item)
+        except _ExtraConditionFailed:
+            existing = self._read_items([HOLD_PREFIX + hold_id], ("expires_at",), consistent=True)
+            hold = existing.get(HOLD_PREFIX + hold_id)
+            if hold is None:  # settled between the transaction and the read
+                raise HoldNotFoundError(f"hold {hold_id} already settled")
+            return {"status": "held", "hold_id": hold_id, "expires_at": int(hold["expires_at"]["N"]), "duplicate": True}
+        return {"status": "held", "hold_id": hold_id, "expires_at": expires_at, "backend": self.backend}
+
+    def confirm(self, hold_id: str) -> Dict[str, object]:
+        try:
+            self.client.delete_item(
+                TableName=self.table.name,
+                Key={"sku": {"S": HOLD_PREFIX + hold_id}},
+                ConditionExpression="attribute_exists(sku) AND #exp > :now",
+                ExpressionAttributeNames={"#exp": "expires_at"},
+                ExpressionAttributeValues={":now": {"N": str(int(time.time()))}},
+            )
+        except ClientError as exc:
+            code = exc.response.get("Error", {}).get("Code")
+            if code == "ConditionalCheckFailedException":
+                # Missing, settled, or expired (the sweeper returns expired stock).
+                raise HoldNotFoundError(f"hold {hold_id} not found or expired") from exc
+            raise InventoryStoreError(f"dynamodb delete failed: {code}") from exc
+        except BotoCoreError as exc:
+            raise InventoryStoreError(f"dynamodb request failed: {exc}") from exc
+        return {"status": "confirmed", "hold_id": hold_id, "backend": self.backend}
+
+    def _settle_hold(self, item: dict) -> bool:
+        """Return a hold's lines to stock and delete it, unless it changed since `item` was read."""
+        key = item["sku"]["S"]
+        lines = {sku: int(value["N"]) for sku, value in item["lines"]["M"].items()}
+        delete = {
+            "Delete": {
+                "TableName": self.table.name,
+                "Key": {"sku": {"S": key}},
+                "ConditionExpression": "attribute_exists(sku) AND #exp = :exp",
+                "ExpressionAttributeNames": {"#exp": "expires_at"},
+                "ExpressionAttributeValues": {":exp": item["expires_at"]},
+            }
+        }
+        try:
+            self._release(lines, extra=delete)
+        except _ExtraConditionFailed:
+            return False
+        return True
+
+    def release_hold(self, hold_id: str) -> Dict[str, object]:
+        key = HOLD_PREFIX + hold_id
+        hold = self._read_items([key], ("lines", "expires_at"), consistent=True).get(key)
+        if hold is None or not self._settle_hold(hold):
+            raise HoldNotFoundError(f"hold {hold_id} not found")
+        return {"status": "released", "hold_id": hold_id, "backend": self.backend}
+
+    def _expired_holds(self, bucket: int, now: int, limit: int) -> List[dict]:
+        try:
+            response = self.client.query(
+                TableName=self.table.name,
+                IndexName=HOLD_INDEX,
+                KeyConditionExpression="#bucket = :bucket AND #exp <= :now",
+                ExpressionAttributeNames={"#bucket": "hold_bucket", "#exp": "expires_at"},
+                ExpressionAttributeValues={":bucket": {"S": str(bucket)}, ":now": {"N": str(now)}},
+                Limit=limit,
+            )
+        except ClientError as exc:
+            code = exc.response.get("Error", {}).get("Code")
+            raise InventoryStoreError(f"dynamodb hold query failed: {code}") from exc
+        except BotoCoreError as exc:
+            raise InventoryStoreError(f"dynamodb request failed: {exc}") from exc
+        return response.get("Items", [])
+
+    def expire_holds(self, limit: int = 100) -> int:
+        now = int(time.time())
+        due: List[dict] = []
+        # Start at a random bucket so concurrent sweepers on other replicas rarely collide.
+        start = random.randrange(self.hold_buckets)
+        for step in range(self.hold_buckets):
+            if len(due) >= limit:
+                break
+            due.extend(self._expired_holds((start + step) % self.hold_buckets, now, limit - len(due)))
+        if not due:
+            return 0
+        if self._sweep_pool is None:
+            self._sweep_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hold-sweep")
+
+        def settle(item: dict) -> bool:
+            try:
+                return self._settle_hold(item)
+            except InventoryStoreError as exc:
+                logger.warning("Failed to release expired hold %s: %s", item["sku"]["S"], exc)
+                return False
+
+        return sum(self._sweep_pool.map(settle, due))
+
+    def close(self) -> None:
+        if self._sweep_pool is not None:
+            self._sweep_pool.shutdown(wait=True)
+
+    # -- reads / maintenance -------------------------------------------------
+
+    def get_stock(self, sku: str) -> int:
+        shards = self._shard_counts([sku]).get(sku, 0)
+        if shards:
+            return sum(self._shard_stocks(sku, shards))
+        item = self._read_items([sku], ("stock",), consistent=True).get(sku, {})
+        return int(item.get("stock", {}).get("N", "0"))
+
+    def layout(self, sku: str) -> Dict[str, object]:
+        shards = self._shard_counts([sku], refresh=True).get(sku, 0)
+        stocks = self._shard_stocks(sku, shards) if shards else []
+        return {"sku": sku, "shards": shards, "stock": self.get_stock(sku), "shard_stock": stocks}
+
+    def reshard(self, sku: str, shards: int, attempts: int = 10, stock: Optional[int] = None) -> Dict[str, object]:
+        """Move `sku` to `shards` shard items (0 or 1 restores the single-item layout).
+
+        The base item and every old and new shard are rewritten in a single
+        transaction conditioned on the values just read, so concurrent orders
+        either land before the reshard or retry against the new layout. When
+        `stock` is given the SKU's total stock is set to it in the same write.
+        """
+        if shards < 0 or shards > MAX_SHARDS:
+            raise ValueError(f"shards must be between 0 and {MAX_SHARDS}")
+        target = shards if shards > 1 else 0
+
+        for attempt in range(attempts):
+            base = self._read_items([sku], ("stock", "shards"), consistent=True).get(sku)
+            if base is None:
+                raise InventoryStoreError(f"unknown sku {sku}")
+            current = int(base.get("shards", {}).get("N", "0"))
+            base_stock = int(base.get("stock", {}).get("N", "0"))
+            old_stocks = self._shard_stocks(sku, current) if current else []
+            total = base_stock + sum(old_stocks) if stock is None else stock
+            if current == target and stock is None:
+                return {"sku": sku, "shards": current, "stock": total, "status": "unchanged"}
+
+            now = datetime.now(timezone.utc).isoformat()
+            if target:
+                share, extra = divmod(total, target)
+                new_stocks = [share + (1 if index < extra else 0) for index in range(target)]
+                base_update = "SET #stock = :zero, #shards = :shards, updated_at = :ts"
+                base_values = {":zero": {"N": "0"}, ":shards": {"N": str(target)}}
+            else:
+                new_stocks = []
+                base_update = "SET #stock = :total, updated_at = :ts REMOVE #shards"
+                base_values = {":total": {"N": str(total)}}
+
+            if current:
+                base_condition = "#stock = :old AND #shards = :current"
+                base_values[":current"] = {"N": str(current)}
+            else:
+                base_condition = "#stock = :old AND attribute_not_exists(#shards)"
+            base_values.update({":old": {"N": str(base_stock)}, ":ts": {"S": now}})
+
+            transact_items: List[dict] = [{
+                "Update": {
+                    "TableName": self.table.name,
+                    "Key": {"sku": {"S": sku}},
+                    "UpdateExpression": base_update,
+                    "ConditionExpression": base_condition,
+                    "ExpressionAttributeNames": {"#stock": "stock", "#shards": "shards"},
+                    "ExpressionAttributeValues": base_values,
+                }
+            }]
+            for index in range(max(current, target)):
+                key = {"sku": {"S": shard_key(sku, index)}}
+                if index < current and index < target:
+                    transact_items.append({"Update": {
+                        "TableName": self.table.name,
+                        "Key": key,
+                        "UpdateExpression": "SET #stock = :new, updated_at = :ts",
+                        "ConditionExpression": "#stock = :old",
+                        "ExpressionAttributeNames": {"#stock": "stock"},
+                        "ExpressionAttributeValues": {
+                            ":new": {"N": str(new_stocks[index])},
+                            ":old": {"N": str(old_stocks[index])},
+                            ":ts": {"S": now},
+                        },
+                    }})
+                elif index < current:
+                    transact_items.append({"Delete": {
+                        "TableName": self.table.name,
+                        "Key": key,
+                        "ConditionExpression": "#stock = :old",
+                        "ExpressionAttributeNames": {"#stock": "stock"},
+                        "ExpressionAttributeValues": {":old": {"N": str(old_stocks[index])}},
+                    }})
+                else:
+                    transact_items.append({"Put": {
+                        "TableName": self.table.name,
+                        "Item": {**key, "stock": {"N": str(new_stocks[index])}, "updated_at": {"S": now}},
+                        "ConditionExpression": "attribute_not_exists(sku)",
+                    }})
+
+            try:
+                self._transact(transact_items)
+            except (_TransactionCancelled, OutOfStockError):
+                logger.info("Reshard of %s raced with writes (attempt %d), retrying", sku, attempt + 1)
+                time.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+                continue
+            self._invalidate([sku])
+            logger.info("Resharded %s from %d to %d shards (stock=%d)", sku, current, target, total)
+            return {"sku": sku, "shards": target, "stock": total, "status": "resharded" if stock is None else "restocked"}
+
+        raise InventoryStoreError(f"reshard of {sku} did not converge after {attempts} attempts")
@@ -0,0 +1,52 @@
+import logging
+import threading
+
+from store import InventoryStore, InventoryStoreError
+
+
+logger = logging.getLogger("inventory-service")
+
+
+class HoldSweeper:
+    """Background thread that returns the stock of expired holds.
+
+    Every `interval` seconds it releases expired holds in batches of
+    `batch_size` until a batch comes back short. Several replicas can sweep
+    at once: each release is conditional on the hold being unchanged.
+    """
+
+    def __init__(self, store: InventoryStore, interval: float = 5.0, batch_size: int = 200):
+        self.store = store
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="hold-sweeper", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def sweep(self) -> int:
+        released = 0
+        while not self._stop.is_set():
+            count = self.store.expire_holds(self.batch_size)
+            released += count
+            if count < self.batch_size:
+                break
+        return released
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                released = self.sweep()
+                if released:
+                    logger.info("Released %d expired holds", released)
+            except NotImplementedError:
+                logger.warning("Inventory backend does not support holds; stopping hold sweeper")
+                return
+            except InventoryStoreError as exc:
+                logger.error("Hold sweep failed: %s", exc)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=self.interval + 5)
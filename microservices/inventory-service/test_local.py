@@ -0,0 +1,142 @@
+import os, sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Ensure src is on the path
+ROOT = Path(__file__).resolve().parent
+SRC = ROOT / "src"
+sys.path.insert(0, str(SRC))
+
+# Use the in-process store so the smoke test needs no AWS access
+os.environ["INVENTORY_BACKEND"] = "memory"
+os.environ["INVENTORY_PUBLISH_ENABLED"] = "0"
+os.environ["INVENTORY_ADMIN_TOKEN"] = "test-admin-token"
+
+from fastapi.testclient import TestClient
+import main
+
+client = TestClient(main.app)
+
+# Health check
+r = client.get("/healthz")
+assert r.status_code == 200, r.text
+print("/healthz ->", r.json())
+r = client.get("/readyz")
+assert r.status_code == 200 and r.json()["ok"], r.text
+print("/readyz ->", r.json())
+
+# Bulk load (CSV with header, then NDJSON increments) needs the admin token
+r = client.post("/inventory/load?format=csv", content=b"sku,stock\nSKU-1,999\n")
+assert r.status_code == 401, r.text
+admin = {"Authorization": "Bearer test-admin-token"}
+r = client.post("/inventory/load?format=csv", content=b"sku,stock\nSKU-1,10\nSKU-2,3\n", headers=admin)
+assert r.status_code == 200 and r.json()["loaded"] == 2, r.text
+r = client.post("/inventory/load?format=ndjson&mode=add", content=b'{"sku": "SKU-2", "qty": 2}\n', headers=admin)
+assert r.status_code == 200, r.text
+assert client.get("/inventory/SKU-2").json()["stock"] == 5
+
+# Concurrent orders never oversell
+def order(n):
+    body = {"order_id": f"o-{n}", "items": [{"sku": "SKU-1", "qty": 1}]}
+    return client.post("/inventory/apply", json=body).json()["status"]
+
+with ThreadPoolExecutor(max_workers=8) as pool:
+    statuses = list(pool.map(order, range(25)))
+assert statuses.count("inventory.updated") == 10, statuses
+assert client.get("/inventory/SKU-1").json()["stock"] == 0
+print("/inventory/apply ->", statuses.count("inventory.updated"), "updated,", statuses.count("inventory.failed"), "failed")
+
+# Route latency histograms are keyed by route template
+r = client.get("/metrics")
+assert r.status_code == 200, r.text
+assert 'http_request_duration_seconds_count{method="POST",route="/inventory/apply",status="200"} 25' in r.text
+assert 'route="/inventory/{sku}"' in r.text
+
+# Holds: reserve, release returns stock, confirm keeps it
+r = client.post("/inventory/reserve", json={"order_id": "h-1", "items": [{"sku": "SKU-2", "qty": 2}]})
+assert r.json()["status"] == "inventory.reserved", r.text
+assert client.get("/inventory/SKU-2").json()["stock"] == 3
+assert client.post("/inventory/holds/h-1/release").status_code == 200
+assert client.get("/inventory/SKU-2").json()["stock"] == 5
+client.post("/inventory/reserve", json={"order_id": "h-2", "items": [{"sku": "SKU-2", "qty": 1}]})
+assert client.post("/inventory/holds/h-2/confirm").status_code == 200
+assert client.post("/inventory/holds/h-2/release").status_code == 404
+assert client.get("/inventory/SKU-2").json()["stock"] == 4
+print("/inventory/reserve -> holds ok")
+
+# A hold id is reserved once, even when retries name different SKUs
+from store import InMemoryInventoryStore, InventoryStoreError
+
+holds = InMemoryInventoryStore()
+skus = [f"H-{n}" for n in range(8)]
+holds.restock({sku: 100 for sku in skus})
+for round_ in range(20):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda sku: holds.reserve(f"dup-{round_}", {sku: 1}, 60), skus))
+assert sum(100 - holds.get_stock(sku) for sku in skus) == 20
+try:
+    holds.reserve("empty", {"H-0": 0}, 60)
+    raise AssertionError("empty hold accepted")
+except InventoryStoreError:
+    pass
+
+# order.created consumer against an in-process broker stand-in
+import json
+from types import SimpleNamespace
+from consumer import OrderCreatedConsumer
+
+# order-service's trace context, as it arrives in the AMQP headers
+TRACEPARENT = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+class FakeChannel:
+    def __init__(self, bodies):
+        self.bodies, self.acks, self.nacks, self.published = bodies, [], [], []
+    def consume(self, queue, inactivity_timeout=None):
+        for tag, body in enumerate(self.bodies, start=1):
+            yield SimpleNamespace(delivery_tag=tag), SimpleNamespace(message_id=None, headers={"traceparent": TRACEPARENT}), body
+        yield None, None, None
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.nacks.append((delivery_tag, requeue))
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.published.append(json.loads(body))
+    def cancel(self):
+        pass
+
+main.get_store().restock({"SKU-3": 3})
+events = [{"orderId": f"c-{n}", "items": [{"sku": "SKU-3", "quantity": 1}]} for n in range(5)]
+channel = FakeChannel([json.dumps(e).encode() for e in events + events[:2]])
+consumer = OrderCreatedConsumer(main.get_store(), batch_size=50, connect=lambda: channel)
+consumer.drain(channel)
+consumer.stop()
+assert channel.acks == [(7, True)] and not channel.nacks, (channel.acks, channel.nacks)
+assert [e["status"] for e in channel.published].count("inventory.updated") == 3
+assert consumer.stats()["duplicates"] == 2
+assert client.get("/inventory/SKU-3").json()["stock"] == 0
+print("order.created consumer ->", consumer.stats())
+
+# Every processed order continues the producer's trace
+import tracing
+consumed = tracing.EXPORTER.recent(trace_id="4bf92f3577b34da6a3ce929d0e0e4736")
+assert len(consumed) == 5 and {t["name"] for t in consumed} == {"consume order.created"}, consumed
+assert consumed[0]["spans"][0]["parent_id"] == "00f067aa0ba902b7"
+
+# A malformed line item is rejected on its own; the rest of the batch is applied and acked
+bad = [{"orderId": "c-ok", "items": [{"sku": "SKU-3", "qty": 1}]}, {"orderId": "c-bad", "items": [{"sku": "SKU-3", "qty": "two"}]}]
+channel = FakeChannel([json.dumps(e).encode() for e in bad])
+consumer = OrderCreatedConsumer(main.get_store(), connect=lambda: channel)
+consumer.drain(channel)
+consumer.stop()
+assert channel.acks == [(1, False)] and channel.nacks == [(2, False)], (channel.acks, channel.nacks)
+assert [e["order_id"] for e in channel.published] == ["c-ok"]
+
+# A redelivery to another consumer (empty in-process dedupe) is recognised by the store
+main.get_store().restock({"SKU-3": 5})
+channel = FakeChannel([json.dumps(e).encode() for e in events[:2]])
+consumer = OrderCreatedConsumer(main.get_store(), connect=lambda: channel)
+consumer.drain(channel)
+consumer.stop()
+assert channel.acks == [(2, True)] and not channel.published, (channel.acks, channel.published)
+assert consumer.stats()["duplicates"] == 2
+assert client.get("/inventory/SKU-3").json()["stock"] == 5
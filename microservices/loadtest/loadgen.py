@@ -0,0 +1,101 @@
+"""Async load generator: N concurrent workers running one operation, closed or open loop.
+
+Closed loop (no `rate`): every worker issues its next operation as soon as the
+previous one finishes. Open loop (`rate` ops/s): operation i is scheduled at
+start + i / rate and its latency is measured from that scheduled time, so a
+stalled server shows up as queueing latency instead of silently lowering the
+offered load (coordinated omission).
+"""
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+Operation = Callable[[int], Awaitable[object]]
+
+
+class OperationError(Exception):
+    """Failed operation, counted under its message (e.g. "http_503") rather than its type."""
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of `samples` (same definition as bench_sharding.py)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+@dataclass
+class LoadResult:
+    latencies: List[float] = field(default_factory=list)  # seconds, successful operations only
+    errors: Dict[str, int] = field(default_factory=dict)
+    seconds: float = 0.0
+    extra: Dict[str, object] = field(default_factory=dict)  # scenario-specific fields for the record
+
+    @property
+    def ok(self) -> int:
+        return len(self.latencies)
+
+    def summary(self) -> Dict[str, object]:
+        ms = [value * 1000.0 for value in self.latencies]
+        return {
+            "ops": self.ok,
+            "errors": sum(self.errors.values()),
+            "error_types": dict(sorted(self.errors.items())),
+            "seconds": round(self.seconds, 3),
+            "throughput": round(self.ok / self.seconds, 1) if self.seconds else 0.0,
+            "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+            "p50_ms": round(percentile(ms, 50), 3),
+            "p95_ms": round(percentile(ms, 95), 3),
+            "p99_ms": round(percentile(ms, 99), 3),
+            "max_ms": round(max(ms), 3) if ms else 0.0,
+            **self.extra,
+        }
+
+
+async def run_load(
+    operation: Operation,
+    concurrency: int = 32,
+    requests: Optional[int] = None,
+    duration: Optional[float] = None,
+    rate: Optional[float] = None,
+) -> LoadResult:
+    """Call `operation(i)` for i = 0, 1, ... until `requests` ops or `duration` seconds.
+
+    An operation fails by raising; failures are counted by exception type, or
+    by message for OperationError.
+    """
+    if requests is None and duration is None:
+        raise ValueError("set requests or duration")
+    result = LoadResult()
+    sequence = itertools.count()
+    started = time.perf_counter()
+    deadline = started + duration if duration is not None else None
+
+    async def worker() -> None:
+        for index in sequence:
+            if requests is not None and index >= requests:
+                return
+            now = time.perf_counter()
+            if deadline is not None and now >= deadline:
+                return
+            scheduled = now
+            if rate:
+                scheduled = started + index / rate
+                if scheduled > now:
+                    await asyncio.sleep(scheduled - now)
+            try:
+                await operation(index)
+            except Exception as exc:
+                name = str(exc) if isinstance(exc, OperationError) else type(exc).__name__
+                result.errors[name] = result.errors.get(name, 0) + 1
+                continue
+            result.latencies.append(time.perf_counter() - scheduled)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    result.seconds = time.perf_counter() - started
+    return result
@@ -0,0 +1,463 @@
+"""Load-test cart-service, order-service and inventory-service against local stand-ins.
+
+In-process (default): each service's FastAPI app is imported from its source
+tree and driven through httpx's ASGI transport, with its backend swapped for a
+stand-in from stubs.py (FakeRedis, the DynamoDB stub, a localhost payment stub
+and an in-memory AMQP broker). No Docker, network or AWS account needed:
+
+    pip install -r requirements.txt
+    python run.py                                   # every scenario, 2000 requests each
+    python run.py --scenario checkout --duration 20 --concurrency 64
+    python run.py --output results.json             # save a run ...
+    python run.py --baseline results.json           # ... and fail on regressions
+
+Over localhost: pass `--cart-url` / `--order-url` / `--inventory-url` to drive
+running services instead; scenarios needing an unset URL are skipped there.
+
+One JSON line per scenario goes to stdout (service logs go to stderr):
+throughput (successful ops/s), mean/p50/p95/p99/max latency in ms and error
+counts. `--output` writes the same records plus run metadata as one JSON
+document; `--baseline` compares against such a document and exits 1 if any
+scenario's p95 rose or its throughput fell by more than `--tolerance`.
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from loadgen import LoadResult, OperationError, run_load
+from stubs import DynamoStubClient, FakeBroker, FakeRedis, PaymentStub, stub_table
+
+ROOT = Path(__file__).resolve().parent
+SERVICES = ROOT.parent
+
+# p95 regressions smaller than this are noise, whatever the relative change.
+P95_SLACK_MS = 0.5
+
+
+def load_service(name: str):
+    """Import `<name>/src/main.py` in isolation and return the module.
+
+    order-service and inventory-service both use top-level module names
+    (`main`, `metrics`, `health`, ...), so the service's own modules are dropped
+    from sys.modules after import; the returned module keeps its references.
+    """
+    root = SERVICES / name
+    # cart-service is a package (`uvicorn src.main:app`); the others run from src/.
+    path, module = (root, "src.main") if name == "cart-service" else (root / "src", "main")
+    before = set(sys.modules)
+    sys.path.insert(0, str(path))
+    try:
+        return importlib.import_module(module)
+    finally:
+        sys.path.remove(str(path))
+        for loaded in set(sys.modules) - before:
+            origin = getattr(sys.modules[loaded], "__file__", None) or ""
+            if origin.startswith(str(root)):
+                del sys.modules[loaded]
+
+
+class Stack:
+    """HTTP clients for the services under test plus the in-process stand-ins."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.payment: Optional[PaymentStub] = None
+        self.broker: Optional[FakeBroker] = None
+        self.inventory = None  # inventory-service main module when in-process
+        self.backends: Dict[str, object] = {}
+
+    @property
+    def mode(self) -> str:
+        return "localhost" if any((self.args.cart_url, self.args.order_url, self.args.inventory_url)) else "in-process"
+
+    def start(self) -> None:
+        limits = httpx.Limits(max_connections=self.args.concurrency * 2, max_keepalive_connections=self.args.concurrency * 2)
+        if self.mode == "localhost":
+            for service, url in (("cart", self.args.cart_url), ("order", self.args.order_url), ("inventory", self.args.inventory_url)):
+                if url:
+                    self.clients[service] = httpx.AsyncClient(base_url=url, limits=limits, timeout=30)
+            return
+
+        args = self.args
+        self.payment = PaymentStub(latency=args.payment_latency_ms / 1000.0).start()
+        self.broker = FakeBroker()
+        # publish_order_created and the inventory consumer import pika lazily; both get the fake broker.
+        sys.modules["pika"] = self.broker.pika_module()
+        os.environ.update({
+            "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+            "HEALTH_CHECK_INTERVAL": "0",
+            # Rate limits and shedding would cap the offered load; measure raw capacity unless asked.
+            "ADMISSION_ENABLED": "1" if args.admission else "0",
+            "CART_USE_REDIS": "0",
+            "INVENTORY_BACKEND": "memory",
+            "INVENTORY_PUBLISH_ENABLED": "0",
+            "INVENTORY_CONSUMER_ENABLED": "0",
+            "INVENTORY_HOLD_SWEEP_INTERVAL": "0",
+            "INVENTORY_ADMIN_TOKEN": "loadtest",
+            "ORDER_PUBLISH_ENABLED": "1",
+            "ORDER_PUBLISH_STRICT": "0",
+            "RABBIT_URL": "amqp://loadtest@fake-broker:5672/%2f",
+            "PAYMENT_ENABLED": "1",
+            "PAYMENT_URL": self.payment.url,
+        })
+
+        cart = load_service("cart-service")
+        if args.cart_backend == "fakeredis":
+            redis = FakeRedis(latency=args.redis_latency_ms / 1000.0)
+            cart._store, cart.STORE_BACKEND = cart.RedisCartStore(redis), "redis"
+            self.backends["cart"] = redis
+        order = load_service("order-service")
+        inventory = load_service("inventory-service")
+        if args.inventory_backend == "dynamo-stub":
+            dynamo = DynamoStubClient(latency=args.dynamo_latency_ms / 1000.0)
+            inventory._store = inventory.DynamoInventoryStore(
+                stub_table(dynamo),
+                sharding=inventory.DDB_SHARDING,
+                hold_buckets=inventory.HOLD_BUCKETS,
+                client=inventory.RetryingClient(dynamo),
+            )
+            self.backends["inventory"] = dynamo
+        self.inventory = inventory
+
+        for service, module in (("cart", cart), ("order", order), ("inventory", inventory)):
+            transport = httpx.ASGITransport(app=module.app)
+            self.clients[service] = httpx.AsyncClient(transport=transport, base_url=f"http://{service}", timeout=30)
+
+    async def close(self) -> None:
+        for client in self.clients.values():
+            await client.aclose()
+        if self.payment is not None:
+            self.payment.stop()
+
+    def backend_stats(self) -> Dict[str, object]:
+        stats: Dict[str, object] = {}
+        if "cart" in self.backends:
+            stats["redis_commands"] = self.backends["cart"].commands
+        if "inventory" in self.backends:
+            stats["dynamodb_calls"] = {name: count for name, count in self.backends["inventory"].calls.items() if count}
+        if self.payment is not None:
+            stats["payment_requests"] = self.payment.requests
+        if self.broker is not None:
+            stats["broker_published"] = self.broker.published
+        return stats
+
+
+async def call(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+    response = await client.request(method, url, **kwargs)
+    if response.status_code >= 400:
+        raise OperationError(f"http_{response.status_code}")
+    return response
+
+
+# -- scenarios ----------------------------------------------------------------
+# Each scenario does its set-up and returns the operation to run under load,
+# or drives the load itself and returns its LoadResult.
+
+
+def _sku(index: int) -> str:
+    return f"LT-SKU-{index:05d}"
+
+
+async def _seed_stock(stack: Stack) -> None:
+    body = "sku,stock\n" + "".join(f"{_sku(i)},{stack.args.stock}\n" for i in range(stack.args.skus))
+    await call(
+        stack.clients["inventory"], "POST", "/inventory/load",
+        params={"format": "csv"}, content=body.encode(), headers={"Authorization": "Bearer loadtest"},
+    )
+
+
+async def cart_browse(stack: Stack):
+    """Read-heavy: GET /cart/{user} over a fixed population of 5-item carts."""
+    cart, users = stack.clients["cart"], stack.args.users
+    for user in range(users):
+        for line in range(5):
+            body = {"productId": _sku(user * 5 + line), "quantity": 1 + line, "price": 9.99}
+            await call(cart, "POST", f"/cart/lt-browse-{user}/items", json=body)
+
+    async def operation(i: int) -> None:
+        await call(cart, "GET", f"/cart/lt-browse-{i % users}")
+
+    return operation
+
+
+async def add_to_cart_storm(stack: Stack):
+    """Write-heavy: POST /cart/{user}/items, many users adding to their carts at once."""
+    cart, users, skus = stack.clients["cart"], stack.args.users, stack.args.skus
+    run = int(time.time())
+
+    async def operation(i: int) -> None:
+        body = {"productId": _sku(i * 7 % skus), "quantity": 1, "price": 14.5}
+        await call(cart, "POST", f"/cart/lt-storm-{run}-{i % users}/items", json=body)
+
+    return operation
+
+
+async def promo_storm(stack: Stack) -> LoadResult:
+    """Bots flood POST /cart/{bot}/items while shoppers add to their own carts.
+
+    The bots offer a fixed `--bot-rate` requests/s whatever the answers are, like
+    a real flood, and ignore Retry-After. Resending the instant a 429 arrives
+    would mostly measure the load generator's own CPU, which shares the event
+    loop with the in-process services.
+
+    Latency and throughput are the shoppers'; the bots' responses are tallied
+    by status under `bots`. Compare runs with and without `--admission`.
+    """
+    cart, args = stack.clients["cart"], stack.args
+    run = int(time.time())
+    stop = asyncio.Event()
+    bots: Dict[str, int] = {}
+    workers = max(1, args.concurrency)
+    interval = workers / args.bot_rate if args.bot_rate > 0 else None
+
+    async def bot(worker: int) -> None:
+        body = {"productId": _sku(worker % args.skus), "quantity": 1, "price": 1.0}
+        scheduled = time.perf_counter() + (interval or 0.0) * worker / workers
+        while interval is not None and not stop.is_set():
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            response = await cart.post(f"/cart/lt-bot-{run}-{worker % args.bots}/items", json=body)
+            bots[str(response.status_code)] = bots.get(str(response.status_code), 0) + 1
+            # A stalled server lowers the bots' rate too, rather than releasing a backlog burst.
+            scheduled = max(scheduled + interval, time.perf_counter())
+
+    async def shopper(i: int) -> None:
+        body = {"productId": _sku(i % args.skus), "quantity": 1, "price": 14.5}
+        await call(cart, "POST", f"/cart/lt-shopper-{run}-{i}/items", json=body)
+
+    flood = [asyncio.create_task(bot(worker)) for worker in range(workers)]
+    try:
+        result = await run_load(
+            shopper,
+            concurrency=args.concurrency,
+            requests=None if args.duration else args.requests,
+            duration=args.duration,
+            rate=args.rate,
+        )
+    finally:
+        stop.set()
+        await asyncio.gather(*flood, return_exceptions=True)
+    result.extra["bots"] = dict(sorted(bots.items()))
+    return result
+
+
+async def checkout(stack: Stack):
+    """Full purchase: add two items, check the cart out, then POST /orders (payment + publish)."""
+    cart, order, skus = stack.clients["cart"], stack.clients["order"], stack.args.skus
+    run = int(time.time())
+
+    async def operation(i: int) -> None:
+        user = f"lt-checkout-{run}-{i}"
+        for line in (i, i + 1):
+            await call(cart, "POST", f"/cart/{user}/items", json={"productId": _sku(line % skus), "quantity": 1, "price": 12.5})
+        lines = (await call(cart, "POST", f"/cart/{user}/checkout")).json()["items"]
+        items = [{"sku": line["productId"], "qty": line["quantity"], "price": line["price"]} for line in lines]
+        await call(order, "POST", "/orders", json={"userId": user, "items": items})
+
+    return operation
+
+
+async def bulk_order(stack: Stack):
+    """Large orders: POST /inventory/apply with `--lines` distinct SKUs in one transaction."""
+    inventory, args = stack.clients["inventory"], stack.args
+    await _seed_stock(stack)
+    lines = min(args.lines, args.skus)
+
+    async def operation(i: int) -> None:
+        picked = random.Random(i).sample(range(args.skus), lines)
+        body = {"order_id": f"lt-bulk-{i}", "items": [{"sku": _sku(sku), "qty": 1} for sku in picked]}
+        await call(inventory, "POST", "/inventory/apply", json=body)
+
+    return operation
+
+
+async def order_pipeline(stack: Stack) -> LoadResult:
+    """In-process only: drain a backlog of order.created events through inventory's batched consumer.
+
+    Latency is publish-to-ack per message, so it includes time queued in the backlog.
+    """
+    inventory, broker, args = stack.inventory, stack.broker, stack.args
+    await _seed_stock(stack)
+    queue = f"lt.order_created.{int(time.time() * 1000)}"
+    broker.bind(queue, inventory.ORDERS_EXCHANGE, "orders.order_created")
+    total = args.requests or 2000
+    for i in range(total):
+        event = {"orderId": f"lt-pipeline-{i}", "items": [{"sku": _sku((i * 13 + k) % args.skus), "qty": 1} for k in range(3)]}
+        broker.publish(inventory.ORDERS_EXCHANGE, "orders.order_created", json.dumps(event))
+
+    consumer = inventory.OrderCreatedConsumer(
+        inventory.get_store(),
+        queue=queue,
+        prefetch=inventory.CONSUMER_PREFETCH,
+        batch_size=inventory.CONSUMER_BATCH_SIZE,
+        flush_interval=inventory.CONSUMER_FLUSH_MS / 1000.0,
+        workers=inventory.CONSUMER_WORKERS,
+        publish=False,
+        connect=broker.channel,
+    )
+    acked = len(broker.ack_latencies)
+    started = time.perf_counter()
+    consumer.start()
+    deadline = started + (args.duration or 120.0)
+    while len(broker.ack_latencies) - acked < total and time.perf_counter() < deadline:
+        await asyncio.sleep(0.005)
+    elapsed = time.perf_counter() - started
+    consumer.stop()
+
+    result = LoadResult(latencies=broker.ack_latencies[acked:acked + total], seconds=elapsed)
+    missing = total - result.ok
+    if missing:
+        result.errors["unacked"] = missing
+    return result
+
+
+# name -> (scenario, services it needs)
+SCENARIOS = {
+    "cart_browse": (cart_browse, ("cart",)),
+    "add_to_cart_storm": (add_to_cart_storm, ("cart",)),
+    "promo_storm": (promo_storm, ("cart",)),
+    "checkout": (checkout, ("cart", "order")),
+    "bulk_order": (bulk_order, ("inventory",)),
+    "order_pipeline": (order_pipeline, ("inventory", "broker")),
+}
+
+
+async def run_scenario(stack: Stack, name: str) -> Optional[dict]:
+    scenario, needs = SCENARIOS[name]
+    available = set(stack.clients) | ({"broker"} if stack.broker is not None else set())
+    missing = [need for need in needs if need not in available]
+    if missing:
+        print(f"skipping {name}: needs {', '.join(missing)}", file=sys.stderr)
+        return None
+
+    args = stack.args
+    prepared = await scenario(stack)
+    if isinstance(prepared, LoadResult):
+        result = prepared
+    else:
+        operation = prepared
+        if args.warmup:
+            await run_load(operation, concurrency=args.concurrency, requests=args.warmup)
+        result = await run_load(
+            operation,
+            concurrency=args.concurrency,
+            requests=None if args.duration else args.requests,
+            duration=args.duration,
+            rate=args.rate,
+        )
+    record = {"scenario": name, "mode": stack.mode, "concurrency": args.concurrency, "rate": args.rate}
+    record.update(result.summary())
+    return record
+
+
+def compare(results: List[dict], baseline: dict, tolerance: float) -> List[dict]:
+    """Scenarios whose p95 grew or throughput dropped by more than `tolerance` vs the baseline run."""
+    previous = {record["scenario"]: record for record in baseline.get("results", [])}
+    regressions = []
+    for record in results:
+        before = previous.get(record["scenario"])
+        if not before:
+            continue
+        if record["p95_ms"] > before["p95_ms"] * (1 + tolerance) + P95_SLACK_MS:
+            regressions.append({"scenario": record["scenario"], "metric": "p95_ms", "baseline": before["p95_ms"], "current": record["p95_ms"]})
+        if record["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append({"scenario": record["scenario"], "metric": "throughput", "baseline": before["throughput"], "current": record["throughput"]})
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+async def run(args: argparse.Namespace, out) -> int:
+    stack = Stack(args)
+    stack.start()
+    results = []
+    try:
+        for name in args.scenario or list(SCENARIOS):
+            record = await run_scenario(stack, name)
+            if record is not None:
+                results.append(record)
+                print(json.dumps(record), file=out, flush=True)
+    finally:
+        await stack.close()
+
+    document = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "mode": stack.mode,
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+            "backends": stack.backend_stats(),
+        },
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(document, indent=2) + "\n")
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        print(json.dumps({"regressions": regressions}), file=out, flush=True)
+        if regressions:
+            return 1
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="repeatable; default: all")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000, help="operations per scenario (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=None, help="seconds per scenario")
+    parser.add_argument("--rate", type=float, default=None, help="open-loop target ops/s (default: closed loop)")
+    parser.add_argument("--warmup", type=int, default=100, help="untimed operations before each scenario")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--bots", type=int, default=4, help="distinct users the promo_storm bots post as")
+    parser.add_argument("--bot-rate", type=float, default=1000, help="requests/s the promo_storm bots offer in total")
+    parser.add_argument("--admission", action="store_true", help="in-process: keep the services' rate limits and load shedding on")
+    parser.add_argument("--skus", type=int, default=1000)
+    parser.add_argument("--stock", type=int, default=1_000_000_000)
+    parser.add_argument("--lines", type=int, default=25, help="line items per bulk order (DynamoDB transactions allow 100)")
+    parser.add_argument("--cart-backend", choices=("fakeredis", "memory"), default="fakeredis")
+    parser.add_argument("--inventory-backend", choices=("dynamo-stub", "memory"), default="dynamo-stub")
+    parser.add_argument("--redis-latency-ms", type=float, default=0.0)
+    parser.add_argument("--dynamo-latency-ms", type=float, default=0.0)
+    parser.add_argument("--payment-latency-ms", type=float, default=0.0)
+    parser.add_argument("--cart-url", help="drive a running cart-service instead of in-process")
+    parser.add_argument("--order-url", help="drive a running order-service instead of in-process")
+    parser.add_argument("--inventory-url", help="drive a running inventory-service instead of in-process")
+    parser.add_argument("--output", help="write results and run metadata to this JSON file")
+    parser.add_argument("--baseline", help="JSON file from an earlier --output run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95/throughput change vs --baseline")
+    args = parser.parse_args(argv)
+
+    # Services print and log per request; keep stdout for the JSON records.
+    out = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        return asyncio.run(run(args, out))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,516 @@
+"""Local stand-ins for the backends the Python services talk to.
+
+- FakeRedis: the subset of redis-py used by RedisCartStore (bytes in, bytes out).
+- DynamoStubClient / stub_table: an in-process DynamoDB low-level client that
+  evaluates the condition and update expressions DynamoInventoryStore sends,
+  including all-or-nothing TransactWriteItems with cancellation reasons.
+- PaymentStub: a localhost HTTP server answering payment-service's POST /payments.
+- FakeBroker: an in-memory AMQP broker (topic bindings, prefetch, acks) plus
+  `pika_module()`, a drop-in for the parts of pika the services use.
+
+Every stand-in takes an optional `latency` (seconds) to model the network hop.
+"""
+import json
+import re
+import threading
+import time
+import types
+from collections import deque
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from botocore.exceptions import ClientError  # type: ignore
+except Exception:  # the stub must work without boto3 installed
+
+    class ClientError(Exception):  # type: ignore[no-redef]
+        def __init__(self, error_response: dict, operation_name: str):
+            super().__init__(f"{operation_name}: {error_response.get('Error', {}).get('Code')}")
+            self.response = error_response
+            self.operation_name = operation_name
+
+
+# -- Redis --------------------------------------------------------------------
+
+
+def _bytes(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode("utf-8")
+
+
+class FakeRedis:
+    """Thread-safe in-memory hash store with redis-py's `decode_responses=False` behaviour."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._hashes: Dict[bytes, Dict[bytes, bytes]] = {}
+        self._lock = threading.Lock()
+        self.commands = 0
+
+    def _hop(self) -> None:
+        self.commands += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def hgetall(self, key) -> Dict[bytes, bytes]:
+        self._hop()
+        with self._lock:
+            return dict(self._hashes.get(_bytes(key), {}))
+
+    def hget(self, key, field) -> Optional[bytes]:
+        self._hop()
+        with self._lock:
+            return self._hashes.get(_bytes(key), {}).get(_bytes(field))
+
+    def hset(self, key, field, value) -> int:
+        self._hop()
+        with self._lock:
+            fields = self._hashes.setdefault(_bytes(key), {})
+            created = _bytes(field) not in fields
+            fields[_bytes(field)] = _bytes(value)
+            return int(created)
+
+    def hdel(self, key, *fields) -> int:
+        self._hop()
+        with self._lock:
+            stored = self._hashes.get(_bytes(key), {})
+            removed = sum(1 for field in fields if stored.pop(_bytes(field), None) is not None)
+            if not stored:
+                self._hashes.pop(_bytes(key), None)
+            return removed
+
+    def delete(self, *keys) -> int:
+        self._hop()
+        with self._lock:
+            return sum(1 for key in keys if self._hashes.pop(_bytes(key), None) is not None)
+
+    def ping(self) -> bool:
+        self._hop()
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+# -- DynamoDB -----------------------------------------------------------------
+
+_EXISTS = re.compile(r"^(attribute_exists|attribute_not_exists)\(\s*([#:\w]+)\s*\)$")
+_COMPARE = re.compile(r"^([#:\w]+)\s*(>=|<=|<>|=|>|<)\s*([#:\w]+)$")
+_ARITHMETIC = re.compile(r"^([#:\w]+)\s*([+-])\s*([#:\w]+)$")
+_ACTIONS = re.compile(r"(SET|ADD|REMOVE)\s+(.*?)(?=\s+(?:SET|ADD|REMOVE)\s+|$)")
+
+
+def _error(code: str, operation: str, **extra) -> ClientError:
+    response = {"Error": {"Code": code, "Message": code}}
+    response.update(extra)
+    return ClientError(response, operation)
+
+
+class _Expression:
+    def __init__(self, names: Optional[dict], values: Optional[dict]):
+        self.names = names or {}
+        self.values = values or {}
+
+    def name(self, token: str) -> str:
+        return self.names[token] if token.startswith("#") else token
+
+    def operand(self, token: str, item: dict) -> Optional[dict]:
+        if token.startswith(":"):
+            return self.values[token]
+        return item.get(self.name(token))
+
+    @staticmethod
+    def scalar(value: Optional[dict]):
+        if value is None:
+            return None
+        if "N" in value:
+            return Decimal(value["N"])
+        if "S" in value:
+            return value["S"]
+        return json.dumps(value, sort_keys=True)
+
+    def holds(self, expression: Optional[str], item: dict) -> bool:
+        if not expression:
+            return True
+        for term in re.split(r"\s+AND\s+", expression.strip()):
+            term = term.strip()
+            match = _EXISTS.match(term)
+            if match:
+                present = self.name(match.group(2)) in item
+                if present != (match.group(1) == "attribute_exists"):
+                    return False
+                continue
+            match = _COMPARE.match(term)
+            if not match:
+                raise _error("ValidationException", "Condition", Message=f"unsupported term {term!r}")
+            left = self.scalar(self.operand(match.group(1), item))
+            right = self.scalar(self.operand(match.group(3), item))
+            if left is None or right is None:
+                return False
+            op = match.group(2)
+            if not {
+                "=": left == right, "<>": left != right,
+                ">": left > right, ">=": left >= right,
+                "<": left < right, "<=": left <= right,
+            }[op]:
+                return False
+        return True
+
+    def apply(self, expression: str, item: dict) -> dict:
+        updated = dict(item)
+        for action, body in _ACTIONS.findall(expression.strip()):
+            for clause in (part.strip() for part in body.split(",")):
+                if action == "SET":
+                    target, value = (side.strip() for side in clause.split("=", 1))
+                    match = _ARITHMETIC.match(value)
+                    if match:
+                        left = self.scalar(self.operand(match.group(1), updated)) or Decimal(0)
+                        right = self.scalar(self.operand(match.group(3), updated)) or Decimal(0)
+                        total = left + right if match.group(2) == "+" else left - right
+                        updated[self.name(target)] = {"N": str(total)}
+                    else:
+                        updated[self.name(target)] = self.operand(value, updated)
+                elif action == "ADD":
+                    target, value = clause.split()
+                    current = self.scalar(updated.get(self.name(target))) or Decimal(0)
+                    updated[self.name(target)] = {"N": str(current + self.scalar(self.operand(value, updated)))}
+                else:
+                    updated.pop(self.name(clause), None)
+        return updated
+
+
+class DynamoStubClient:
+    """In-process stand-in for the DynamoDB low-level client (single table, hash key `sku`).
+
+    Wrap it in the service's RetryingClient like the real client. Writes are
+    serialised under one lock, so transactions are atomic and isolated.
+    """
+
+    OPERATIONS = (
+        "describe_table", "batch_get_item", "batch_write_item", "transact_write_items",
+        "update_item", "delete_item", "query",
+    )
+
+    def __init__(self, table_name: str = "inventory-stub", latency: float = 0.0):
+        self.table_name = table_name
+        self.latency = latency
+        self.items: Dict[str, dict] = {}
+        self.calls: Dict[str, int] = {name: 0 for name in self.OPERATIONS}
+        self._lock = threading.Lock()
+        # RetryingClient only wraps names listed here, like botocore's client.meta.
+        self.meta = types.SimpleNamespace(method_to_api_mapping={name: name for name in self.OPERATIONS})
+
+    def _hop(self, operation: str) -> None:
+        self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def describe_table(self, TableName: str) -> dict:
+        self._hop("describe_table")
+        return {"Table": {"TableName": TableName, "TableStatus": "ACTIVE", "ItemCount": len(self.items)}}
+
+    def batch_get_item(self, RequestItems: dict) -> dict:
+        self._hop("batch_get_item")
+        responses: Dict[str, List[dict]] = {}
+        with self._lock:
+            for table, request in RequestItems.items():
+                found = [self.items[key["sku"]["S"]] for key in request["Keys"] if key["sku"]["S"] in self.items]
+                responses[table] = [dict(item) for item in found]
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+    def batch_write_item(self, RequestItems: dict) -> dict:
+        self._hop("batch_write_item")
+        with self._lock:
+            for requests in RequestItems.values():
+                for request in requests:
+                    if "PutRequest" in request:
+                        item = request["PutRequest"]["Item"]
+                        self.items[item["sku"]["S"]] = dict(item)
+                    else:
+                        self.items.pop(request["DeleteRequest"]["Key"]["sku"]["S"], None)
+        return {"UnprocessedItems": {}}
+
+    def _write(self, kind: str, spec: dict, commit: bool) -> bool:
+        """Check (and with `commit`, perform) one Put/Update/Delete/ConditionCheck."""
+        expression = _Expression(spec.get("ExpressionAttributeNames"), spec.get("ExpressionAttributeValues"))
+        key = (spec.get("Item") or spec["Key"])["sku"]["S"]
+        current = self.items.get(key, {})
+        if not expression.holds(spec.get("ConditionExpression"), current):
+            return False
+        if commit:
+            if kind == "Put":
+                self.items[key] = dict(spec["Item"])
+            elif kind == "Delete":
+                self.items.pop(key, None)
+            elif kind == "Update":
+                self.items[key] = expression.apply(spec["UpdateExpression"], dict(current, sku={"S": key}))
+        return True
+
+    def transact_write_items(self, TransactItems: List[dict], ReturnConsumedCapacity: str = "NONE") -> dict:
+        self._hop("transact_write_items")
+        operations: List[Tuple[str, dict]] = [next(iter(entry.items())) for entry in TransactItems]
+        keys = [(spec.get("Item") or spec["Key"])["sku"]["S"] for _, spec in operations]
+        if len(set(keys)) != len(keys):
+            raise _error("ValidationException", "TransactWriteItems")
+        with self._lock:
+            passed = [self._write(kind, spec, commit=False) for kind, spec in operations]
+            if not all(passed):
+                reasons = [{"Code": "None" if ok else "ConditionalCheckFailed"} for ok in passed]
+                raise _error("TransactionCanceledException", "TransactWriteItems", CancellationReasons=reasons)
+            for kind, spec in operations:
+                self._write(kind, spec, commit=True)
+        response: dict = {}
+        if ReturnConsumedCapacity != "NONE":
+            # Transactional writes cost two write units per item (items are < 1 KB).
+            response["ConsumedCapacity"] = [{"TableName": self.table_name, "CapacityUnits": 2.0 * len(operations)}]
+        return response
+
+    def update_item(self, **spec) -> dict:
+        self._hop("update_item")
+        with self._lock:
+            if not self._write("Update", spec, commit=True):
+                raise _error("ConditionalCheckFailedException", "UpdateItem")
+        return {}
+
+    def delete_item(self, **spec) -> dict:
+        self._hop("delete_item")
+        with self._lock:
+            if not self._write("Delete", spec, commit=True):
+                raise _error("ConditionalCheckFailedException", "DeleteItem")
+        return {}
+
+    def query(self, TableName: str, KeyConditionExpression: str, ExpressionAttributeNames=None,
+              ExpressionAttributeValues=None, IndexName: Optional[str] = None, Limit: int = 100) -> dict:
+        self._hop("query")
+        expression = _Expression(ExpressionAttributeNames, ExpressionAttributeValues)
+        with self._lock:
+            matches = [dict(item) for item in self.items.values() if expression.holds(KeyConditionExpression, item)]
+        matches.sort(key=lambda item: expression.scalar(item.get("expires_at")) or 0)
+        return {"Items": matches[:Limit], "Count": min(len(matches), Limit)}
+
+
+def stub_table(client: DynamoStubClient):
+    """Object with the `name` / `meta.client` attributes DynamoInventoryStore reads from a boto3 Table."""
+    return types.SimpleNamespace(name=client.table_name, meta=types.SimpleNamespace(client=client))
+
+
+# -- payment-service ------------------------------------------------------------
+
+
+class PaymentStub:
+    """Threaded localhost server approving every POST after `latency` seconds."""
+
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):  # noqa: N802 - http.server naming
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if stub.latency:
+                    time.sleep(stub.latency)
+                stub.requests += 1
+                body = json.dumps({"order_id": request.get("order_id"), "status": "payment.approved"}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # silence per-request logging
+                pass
+
+        self.latency = latency
+        self.requests = 0
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="payment-stub", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/payments"
+
+    def start(self) -> "PaymentStub":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# -- RabbitMQ -------------------------------------------------------------------
+
+
+def _topic_matches(pattern: str, key: str) -> bool:
+    regex = "^" + re.escape(pattern).replace(r"\#", ".*").replace(r"\*", "[^.]+") + "$"
+    return re.match(regex, key) is not None
+
+
+class FakeBroker:
+    """In-memory AMQP broker: durable-ish queues, topic bindings, prefetch and acks.
+
+    Records the time each message was published so consumers can be measured
+    end to end (`ack_latencies`).
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.queues: Dict[str, Deque[Tuple[bytes, object, float]]] = {}
+        self.bindings: List[Tuple[str, str, str]] = []
+        self.published = 0
+        self.ack_latencies: List[float] = []
+        self._cond = threading.Condition()
+
+    def declare_queue(self, queue: str) -> None:
+        with self._cond:
+            self.queues.setdefault(queue, deque())
+
+    def bind(self, queue: str, exchange: str, routing_key: str) -> None:
+        with self._cond:
+            self.queues.setdefault(queue, deque())
+            if (queue, exchange, routing_key) not in self.bindings:
+                self.bindings.append((queue, exchange, routing_key))
+
+    def publish(self, exchange: str, routing_key: str, body, properties=None) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        body = _bytes(body)
+        with self._cond:
+            if exchange == "":
+                targets = [routing_key]
+                self.queues.setdefault(routing_key, deque())
+            else:
+                targets = [queue for queue, ex, pattern in self.bindings if ex == exchange and _topic_matches(pattern, routing_key)]
+            for queue in targets:
+                self.queues[queue].append((body, properties, time.monotonic()))
+            self.published += 1
+            self._cond.notify_all()
+
+    def depth(self, queue: str) -> int:
+        with self._cond:
+            return len(self.queues.get(queue, ()))
+
+    def channel(self) -> "FakeChannel":
+        return FakeChannel(self, _FakeConnection(self))
+
+    def pika_module(self) -> types.ModuleType:
+        """A stand-in `pika` module whose connections all reach this broker."""
+        broker = self
+        module = types.ModuleType("pika")
+        module.URLParameters = lambda url: url
+        module.BlockingConnection = lambda params=None: _FakeConnection(broker)
+
+        def basic_properties(**kwargs):
+            kwargs.setdefault("message_id", None)
+            kwargs.setdefault("correlation_id", None)
+            return types.SimpleNamespace(**kwargs)
+
+        module.BasicProperties = basic_properties
+        return module
+
+
+class _FakeConnection:
+    def __init__(self, broker: FakeBroker):
+        self.broker = broker
+        self.is_open = True
+
+    def channel(self) -> "FakeChannel":
+        return FakeChannel(self.broker, self)
+
+    def close(self) -> None:
+        self.is_open = False
+
+
+class FakeChannel:
+    def __init__(self, broker: FakeBroker, connection: _FakeConnection):
+        self.broker = broker
+        self.connection = connection
+        self.prefetch = 0
+        self._next_tag = 1
+        self._unacked: Dict[int, Tuple[str, bytes, object, float]] = {}
+        self._cancelled = False
+
+    def exchange_declare(self, exchange: str, exchange_type: str = "direct", durable: bool = False) -> None:
+        pass
+
+    def queue_declare(self, queue: str, durable: bool = False) -> None:
+        self.broker.declare_queue(queue)
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: str) -> None:
+        self.broker.bind(queue, exchange, routing_key)
+
+    def basic_qos(self, prefetch_count: int = 0) -> None:
+        self.prefetch = prefetch_count
+
+    def basic_publish(self, exchange: str, routing_key: str, body, properties=None) -> None:
+        self.broker.publish(exchange, routing_key, body, properties)
+
+    def consume(self, queue: str, inactivity_timeout: Optional[float] = None) -> Iterator[tuple]:
+        broker = self.broker
+        while not self._cancelled:
+            with broker._cond:
+                waiting = broker.queues.setdefault(queue, deque())
+                deadline = None if inactivity_timeout is None else time.monotonic() + inactivity_timeout
+                while not self._cancelled and (not waiting or (self.prefetch and len(self._unacked) >= self.prefetch)):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    broker._cond.wait(remaining)
+                if self._cancelled:
+                    return
+                ready = waiting and not (self.prefetch and len(self._unacked) >= self.prefetch)
+                if ready:
+                    body, properties, published_at = waiting.popleft()
+                    tag = self._next_tag
+                    self._next_tag += 1
+                    self._unacked[tag] = (queue, body, properties, published_at)
+            if not ready:
+                yield None, None, None
+                continue
+            method = types.SimpleNamespace(delivery_tag=tag, routing_key=queue)
+            yield method, properties or types.SimpleNamespace(message_id=None), body
+
+    def basic_ack(self, delivery_tag: int, multiple: bool = False) -> None:
+        now = time.monotonic()
+        with self.broker._cond:
+            tags = [tag for tag in self._unacked if tag <= delivery_tag] if multiple else [delivery_tag]
+            for tag in tags:
+                entry = self._unacked.pop(tag, None)
+                if entry is not None:
+                    self.broker.ack_latencies.append(now - entry[3])
+            self.broker._cond.notify_all()
+
+    def basic_nack(self, delivery_tag: int, requeue: bool = True) -> None:
+        with self.broker._cond:
+            entry = self._unacked.pop(delivery_tag, None)
+            if entry is not None and requeue:
+                queue, body, properties, published_at = entry
+                self.broker.queues[queue].appendleft((body, properties, published_at))
+            self.broker._cond.notify_all()
+
+    def cancel(self) -> None:
+        with self.broker._cond:
+            self._cancelled = True
+            self.broker._cond.notify_all()
+
+
+if __name__ == "__main__":
+    # Payment stub for localhost runs: point order-service's PAYMENT_URL at the printed URL.
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the payment-service stub on localhost.")
+    parser.add_argument("--port", type=int, default=9090)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    payment = PaymentStub(latency=args.latency_ms / 1000.0, port=args.port).start()
+    print(f"payment stub listening on {payment.url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        payment.stop()
@@ -0,0 +1,469 @@
+"""Admission control: per-user/per-IP rate limits, an in-flight cap and load shedding, stdlib only.
+
+A pure ASGI middleware, so rejected requests never reach routing, validation or
+a backend. Checks, cheapest first:
+
+1. Limited routes (e.g. `POST /cart/{user_id}/items`) take a token from the
+   caller's user bucket (the `user_id` path parameter, or a JSON body field) and
+   IP bucket. At most ADMISSION_MAX_BODY_BYTES of a body are buffered to find
+   its user field; a larger body is passed through and only the IP bucket and
+   the in-flight cap apply to it. Empty buckets get `429` with `Retry-After` set to when the next
+   token is due. Buckets are local to the worker unless RATE_LIMIT_REDIS_URL is
+   set: the limit then holds across workers and replicas, and a worker falls
+   back to its local buckets for a few seconds whenever Redis errors or is slow.
+2. Limited routes are shed with `503` and `Retry-After` while the backend's
+   recent latency (a quantile of the service's own backend histogram over the
+   last SHED_WINDOW_SECONDS) is above the threshold. The shed share grows each
+   window the backend stays slow and decays once it recovers, so some traffic
+   keeps flowing and keeps measuring the backend.
+3. Every request except probes and metrics counts against the worker's in-flight
+   cap. Over it, up to ADMISSION_QUEUE_SIZE requests wait FIFO for at most
+   ADMISSION_QUEUE_TIMEOUT_MS; the rest get `503` and `Retry-After` at once,
+   instead of queueing without bound for a thread.
+
+Rejections are counted in `admission_rejected_total{route,reason}`.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import re
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from metrics import Histogram, callback_metric, counter
+
+
+SERVICE = "order-service"
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1").lower() in ("1", "true", "yes", "on")
+# Per-user token bucket on limited routes: sustained requests/s and burst (0 = off)
+RATE_LIMIT_USER_RPS = float(os.getenv("RATE_LIMIT_USER_RPS", "5"))
+RATE_LIMIT_USER_BURST = float(os.getenv("RATE_LIMIT_USER_BURST", "20"))
+# Per-IP bucket; off by default since in-cluster callers share the frontend's address
+RATE_LIMIT_IP_RPS = float(os.getenv("RATE_LIMIT_IP_RPS", "0"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "100"))
+# Key IP buckets on the first X-Forwarded-For address (set by the frontend's nginx) instead of the peer
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "0").lower() in ("1", "true", "yes", "on")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "")
+RATE_LIMIT_REDIS_TIMEOUT = float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT_MS", "50")) / 1000.0
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "200")) / 1000.0
+SHED_QUANTILE = float(os.getenv("SHED_QUANTILE", "0.95"))
+SHED_WINDOW_SECONDS = float(os.getenv("SHED_WINDOW_SECONDS", "2"))
+# Shed share added per slow window (half of it is removed per healthy one), and its ceiling
+SHED_STEP = float(os.getenv("SHED_STEP", "0.2"))
+SHED_MAX = float(os.getenv("SHED_MAX", "0.9"))
+RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+# Largest body buffered to find the caller's user field (an order of a few hundred lines);
+# larger bodies skip the per-user limit
+ADMISSION_MAX_BODY_BYTES = int(os.getenv("ADMISSION_MAX_BODY_BYTES", "16384"))
+
+USER_PARAM = "user_id"
+# After a Redis error, use the local buckets for this long before trying Redis again
+REDIS_RETRY_SECONDS = 5.0
+
+REJECTED = counter("admission_rejected_total", "Requests rejected by admission control.", ("route", "reason"))
+
+logger = logging.getLogger("order-service")
+
+
+class TokenBuckets:
+    """Token buckets keyed by caller, refilled lazily on each take.
+
+    Not thread-safe: the middleware only calls it from the event loop.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100_000):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_keys = max_keys
+        self._buckets: Dict[str, List[float]] = {}  # key -> [tokens, last refill]
+
+    def take(self, key: str, now: Optional[float] = None) -> float:
+        """Take a token for `key`: 0.0 when allowed, else seconds until one is available."""
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._evict(now)
+            self._buckets[key] = [self.burst - 1.0, now]
+            return 0.0
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1.0:
+            bucket[0] = tokens - 1.0
+            return 0.0
+        bucket[0] = tokens
+        return (1.0 - tokens) / self.rate
+
+    def _evict(self, now: float) -> None:
+        # A bucket that has refilled is the same as no bucket at all.
+        idle = [key for key, (tokens, last) in self._buckets.items() if tokens + (now - last) * self.rate >= self.burst]
+        for key in idle:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_keys:  # all busy: drop the oldest half
+            for key in list(self._buckets)[: len(self._buckets) // 2]:
+                del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+# Same refill rule as TokenBuckets.take, atomically in Redis on the server's clock.
+_REDIS_TAKE = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local last = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - last) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RateLimit:
+    """A named token-bucket limit, kept locally or, with `redis_url`, shared through Redis."""
+
+    def __init__(self, name: str, rate: float, burst: float, redis_url: str = ""):
+        self.name = name
+        self.local = TokenBuckets(rate, burst, RATE_LIMIT_MAX_KEYS)
+        self.redis_url = redis_url
+        self._prefix = f"ratelimit:{SERVICE}:{name}:"
+        self._script = None
+        self._redis_down_until = 0.0
+
+    def _shared(self):
+        # Built on first use, inside the worker's event loop (redis.asyncio pools bind to it).
+        if self._script is None:
+            try:
+                import redis.asyncio as aioredis  # type: ignore
+            except ImportError:
+                logger.warning("RATE_LIMIT_REDIS_URL set but the redis library is unavailable; %s limits stay per worker", self.name)
+                self.redis_url = ""
+                return None
+            client = aioredis.from_url(
+                self.redis_url,
+                socket_timeout=RATE_LIMIT_REDIS_TIMEOUT,
+                socket_connect_timeout=RATE_LIMIT_REDIS_TIMEOUT,
+            )
+            self._script = client.register_script(_REDIS_TAKE)
+        return self._script
+
+    async def take(self, key: str) -> float:
+        now = time.monotonic()
+        if not self.redis_url or now < self._redis_down_until:
+            return self.local.take(key, now)
+        script = self._shared()
+        if script is None:
+            return self.local.take(key, now)
+        try:
+            return float(await script(keys=[self._prefix + key], args=[self.local.rate, self.local.burst]))
+        except Exception as exc:
+            logger.warning("Shared %s rate limit unavailable, using local buckets for %.0fs: %s", self.name, REDIS_RETRY_SECONDS, exc)
+            self._redis_down_until = now + REDIS_RETRY_SECONDS
+            return self.local.take(key, now)
+
+
+class ConcurrencyLimit:
+    """At most `limit` requests in flight; up to `queue_size` more wait FIFO for `timeout` seconds."""
+
+    def __init__(self, limit: int, queue_size: int = 64, timeout: float = 0.2):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.queue_size or self.timeout <= 0:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            return False
+        except asyncio.CancelledError:
+            # The client went away; hand on a slot it may have been given in the meantime.
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._discard(waiter)
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # the slot passes straight to the oldest waiter
+                return
+        self.in_flight -= 1
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+
+def _quantile(bounds: Sequence[float], counts: Sequence[int], q: float) -> Optional[float]:
+    """Quantile of histogram bucket counts (last one +Inf), interpolated within the bucket."""
+    total = sum(counts)
+    if total <= 0:
+        return None
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(counts):
+        if count and seen + count >= rank:
+            if index >= len(bounds):
+                return bounds[-1]
+            lower = bounds[index - 1] if index else 0.0
+            return lower + (bounds[index] - lower) * (rank - seen) / count
+        seen += count
+    return bounds[-1]
+
+
+class LatencyShedder:
+    """Share of requests to shed, driven by the recent latency of a backend histogram.
+
+    Reads the histogram at most once per `window` seconds, on the request path,
+    and estimates `quantile` over the observations made since the last read.
+    """
+
+    def __init__(self, histogram: Histogram, threshold: float, quantile: float = 0.95, window: float = 2.0):
+        self.histogram = histogram
+        self.threshold = threshold
+        self.quantile = quantile
+        self.window = window
+        self.ratio = 0.0
+        self.latency: Optional[float] = None
+        self._previous: Optional[List[int]] = None
+        self._checked = 0.0
+
+    def _counts(self) -> List[int]:
+        totals = [0] * (len(self.histogram.buckets) + 1)
+        for _, values in self.histogram.collect()["series"]:
+            for index, count in enumerate(values[:-1]):
+                totals[index] += count
+        return totals
+
+    def update(self, now: float) -> None:
+        if now - self._checked < self.window:
+            return
+        self._checked = now
+        counts = self._counts()
+        previous, self._previous = self._previous, counts
+        if previous is None:
+            return
+        self.latency = _quantile(self.histogram.buckets, [a - b for a, b in zip(counts, previous)], self.quantile)
+        if self.latency is not None and self.latency > self.threshold:
+            if self.ratio == 0.0:
+                logger.warning("Backend p%g %.0f ms above %.0f ms; shedding limited routes", self.quantile * 100, self.latency * 1000, self.threshold * 1000)
+            self.ratio = min(SHED_MAX, self.ratio + SHED_STEP)
+        else:
+            self.ratio = max(0.0, self.ratio - SHED_STEP / 2)
+
+    def shed(self) -> bool:
+        self.update(time.monotonic())
+        return self.ratio > 0.0 and random.random() < self.ratio
+
+
+def _compile(template: str) -> Tuple[str, "re.Pattern[str]", str]:
+    method, path = template.split(" ", 1)
+    pattern = re.sub(r"\\\{(\w+)\\\}", r"(?P<\1>[^/]+)", re.escape(path))
+    return method.upper(), re.compile(f"^{pattern}$"), path
+
+
+async def _buffer_body(receive, limit: int):
+    """Read the whole request body; return it and a `receive` that replays it to the app.
+
+    Reading stops once the body grows past `limit` bytes: the body is then None
+    and the replay continues with the rest of the request after what was read.
+    """
+    messages = []
+    body = b""
+    truncated = False
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        body += message.get("body", b"")
+        if len(body) > limit:
+            truncated = True
+            break
+        if not message.get("more_body"):
+            break
+    pending = deque(messages)
+
+    async def replay():
+        return pending.popleft() if pending else await receive()
+
+    return (None if truncated else body), replay
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _reject(send, status: int, retry_after: float, detail: str) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class Admission:
+    """Limits for one app: limited routes with their rate limits and shedder, and the in-flight cap."""
+
+    def __init__(
+        self,
+        limited: Iterable[str] = (),
+        user_field: Optional[str] = None,
+        backend: Optional[Histogram] = None,
+        shed_latency_ms: float = 0.0,
+        max_concurrency: int = 0,
+    ):
+        self.routes = [_compile(template) for template in limited]
+        self.user_field = user_field
+        self.users = RateLimit("user", RATE_LIMIT_USER_RPS, RATE_LIMIT_USER_BURST, RATE_LIMIT_REDIS_URL) if RATE_LIMIT_USER_RPS > 0 else None
+        self.ips = RateLimit("ip", RATE_LIMIT_IP_RPS, RATE_LIMIT_IP_BURST, RATE_LIMIT_REDIS_URL) if RATE_LIMIT_IP_RPS > 0 else None
+        self.shedder = (
+            LatencyShedder(backend, shed_latency_ms / 1000.0, SHED_QUANTILE, SHED_WINDOW_SECONDS)
+            if backend is not None and shed_latency_ms > 0 else None
+        )
+        self.concurrency = ConcurrencyLimit(max_concurrency, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT) if max_concurrency > 0 else None
+
+    def match(self, scope) -> Tuple[Optional[str], Dict[str, str]]:
+        """Route template and path parameters of a limited route, or (None, {})."""
+        method, path = scope["method"], scope["path"]
+        for route_method, pattern, template in self.routes:
+            if route_method == method:
+                found = pattern.match(path)
+                if found:
+                    return template, found.groupdict()
+        return None, {}
+
+    def _client_ip(self, scope) -> str:
+        if RATE_LIMIT_TRUST_FORWARDED:
+            forwarded = _header(scope, b"x-forwarded-for")
+            if forwarded:
+                return forwarded.split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def check(self, params: Dict[str, str], scope, receive):
+        """(status, retry_after, reason) when a limited-route request must be rejected, else None; and the `receive` to use."""
+        if self.users is not None:
+            user = params.get(USER_PARAM)
+            if user is None and self.user_field:
+                # Too large to look for the user field: not rate limited per user.
+                declared = _header(scope, b"content-length")
+                if not (declared and declared.isdigit() and int(declared) > ADMISSION_MAX_BODY_BYTES):
+                    body, receive = await _buffer_body(receive, ADMISSION_MAX_BODY_BYTES)
+                    try:
+                        payload = json.loads(body) if body else None
+                        user = payload.get(self.user_field) if isinstance(payload, dict) else None
+                    except ValueError:
+                        user = None  # left for request validation to reject
+            if user:
+                wait = await self.users.take(str(user))
+                if wait:
+                    return (429, wait, "user_rate_limited"), receive
+        if self.ips is not None:
+            wait = await self.ips.take(self._client_ip(scope))
+            if wait:
+                return (429, wait, "ip_rate_limited"), receive
+        if self.shedder is not None and self.shedder.shed():
+            return (503, RETRY_AFTER_SECONDS, "shed"), receive
+        return None, receive
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, admission: Admission, skip: Iterable[str] = ("/healthz", "/readyz", "/metrics", "/debug/traces")):
+        self.app = app
+        self.admission = admission
+        self.skipped = set(skip)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skipped:
+            await self.app(scope, receive, send)
+            return
+        admission = self.admission
+        template, params = admission.match(scope)
+        if template is not None:
+            rejection, receive = await admission.check(params, scope, receive)
+            if rejection is not None:
+                status, retry_after, reason = rejection
+                REJECTED.inc(template, reason)
+                await _reject(send, status, retry_after, "rate limit exceeded" if status == 429 else "service overloaded, retry later")
+                return
+        concurrency = admission.concurrency
+        if concurrency is None:
+            await self.app(scope, receive, send)
+            return
+        if not await concurrency.acquire():
+            REJECTED.inc(template or "other", "overloaded")
+            await _reject(send, 503, RETRY_AFTER_SECONDS, "service overloaded, retry later")
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            concurrency.release()
+
+
+def admit_app(
+    app,
+    limited: Iterable[str] = (),
+    user_field: Optional[str] = None,
+    backend: Optional[Histogram] = None,
+    shed_latency_ms: float = 0.0,
+    max_concurrency: int = 0,
+) -> Optional[Admission]:
+    """Put admission control in front of `app` (outermost of the middleware added so far).
+
+    `limited` are "METHOD /route/{template}" strings; their caller is the `user_id`
+    path parameter or, failing that, the JSON body's `user_field`. `backend` is the
+    histogram whose latency drives shedding above `shed_latency_ms` (0 = off);
+    `max_concurrency` caps in-flight requests per worker (0 = no cap).
+    Returns None when ADMISSION_ENABLED is off.
+    """
+    if not ADMISSION_ENABLED:
+        return None
+    admission = Admission(limited, user_field, backend, shed_latency_ms, max_concurrency)
+    app.add_middleware(AdmissionMiddleware, admission=admission)
+    callback_metric(
+        "admission_requests",
+        "Requests in flight and waiting for an admission slot.",
+        ("state",),
+        lambda: {("in_flight",): admission.concurrency.in_flight, ("queued",): admission.concurrency.queued} if admission.concurrency else {},
+    )
+    return admission
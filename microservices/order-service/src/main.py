@@ -1,15 +1,64 @@
+from contextlib import asynccontextmanager
+from anyio import to_thread
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from publisher import publish_order_created
+from admission import admit_app
+from health import HealthMonitor
+from metrics import histogram, instrument_app
+from publisher import ORDER_PUBLISH_ENABLED, ORDER_PUBLISH_STRICT, RABBIT_URL, publish_order_created
+from tracing import inject, set_correlation_id, span, trace_app
 from dotenv import load_dotenv, find_dotenv
-import uuid, os, datetime, json, urllib.request, urllib.error
+from urllib.parse import urlparse
+import uuid, os, datetime, json, socket, urllib.request, urllib.error
 
 # Load environment variables from a .env file if present (search up the tree)
 load_dotenv(find_dotenv())
 
-app = FastAPI()
 DATABASE_URL = os.getenv("DATABASE_URL", "")
 PAYMENT_DEFAULT_URL = "http://payment-service.bookstore.svc.cluster.local:8080/payments"
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))
+# Threads running sync routes (create_order blocks on the payment call), per worker process
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+# Admission control (admission.py): requests in flight per worker, and the payment-service p95 above which orders are shed
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", str(THREADPOOL_SIZE)))
+SHED_LATENCY_MS = float(os.getenv("SHED_LATENCY_MS", "2000"))
+PAYMENT_SECONDS = histogram("order_payment_request_seconds", "Latency of the payment-service call made by trigger_payment.")
+
+
+def _check_broker() -> None:
+    # Only a strict publisher makes RabbitMQ a hard dependency; a TCP connect is enough to tell.
+    if not (ORDER_PUBLISH_ENABLED and ORDER_PUBLISH_STRICT):
+        return
+    parsed = urlparse(RABBIT_URL)
+    with socket.create_connection((parsed.hostname or "localhost", parsed.port or 5672), timeout=2):
+        pass
+
+
+health = HealthMonitor(_check_broker, interval=HEALTH_CHECK_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    health.start()
+    yield
+    health.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+instrument_app(app)
+trace_app(app)
+# Orders carry the user in the body, not the path
+admit_app(
+    app,
+    limited=("POST /orders",),
+    user_field="userId",
+    backend=PAYMENT_SECONDS,
+    shed_latency_ms=SHED_LATENCY_MS,
+    max_concurrency=MAX_CONCURRENCY,
+)
 
 
 def _truthy(value: str | None, default: bool = False) -> bool:
@@ -37,31 +86,33 @@ def trigger_payment(order_id: str, user_id: str, total: float) -> dict | None:
         "total_amount": total,
     }).encode("utf-8")
 
-    req = urllib.request.Request(
-        _payment_url(),
-        data=payload,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
     timeout = float(os.getenv("PAYMENT_TIMEOUT", "5"))
 
-    try:
-        with urllib.request.urlopen(req, timeout=timeout) as response:  # nosec B310
-            body = response.read().decode("utf-8") or "{}"
-            result = json.loads(body)
-    except urllib.error.HTTPError as exc:
-        detail = exc.read().decode("utf-8") or exc.reason or str(exc.code)
-        message = f"payment HTTP error: {detail}"
-        print(f"[order-service] {message}")
-        if _truthy(os.getenv("PAYMENT_STRICT")):
-            raise HTTPException(status_code=502, detail=message) from exc
-        return {"order_id": order_id, "status": "payment.error", "error": detail}
-    except Exception as exc:
-        message = f"payment request failed: {exc}"
-        print(f"[order-service] {message}")
-        if _truthy(os.getenv("PAYMENT_STRICT")):
-            raise HTTPException(status_code=502, detail=message) from exc
-        return {"order_id": order_id, "status": "payment.error", "error": str(exc)}
+    with PAYMENT_SECONDS.time(), span("payment.request", order_id=order_id):
+        req = urllib.request.Request(
+            _payment_url(),
+            data=payload,
+            # traceparent / X-Correlation-ID let payment-service join this order's trace
+            headers=inject({"Content-Type": "application/json"}),
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as response:  # nosec B310
+                body = response.read().decode("utf-8") or "{}"
+                result = json.loads(body)
+        except urllib.error.HTTPError as exc:
+            detail = exc.read().decode("utf-8") or exc.reason or str(exc.code)
+            message = f"payment HTTP error: {detail}"
+            print(f"[order-service] {message}")
+            if _truthy(os.getenv("PAYMENT_STRICT")):
+                raise HTTPException(status_code=502, detail=message) from exc
+            return {"order_id": order_id, "status": "payment.error", "error": detail}
+        except Exception as exc:
+            message = f"payment request failed: {exc}"
+            print(f"[order-service] {message}")
+            if _truthy(os.getenv("PAYMENT_STRICT")):
+                raise HTTPException(status_code=502, detail=message) from exc
+            return {"order_id": order_id, "status": "payment.error", "error": str(exc)}
 
     if not isinstance(result, dict):
         result = {"order_id": order_id, "status": "payment.unknown"}
@@ -81,7 +132,15 @@ class OrderReq(BaseModel):
     items: list[Item]
 
 @app.get("/healthz")
-def healthz(): return {"ok": True, "db": bool(DATABASE_URL)}
+async def healthz(): return {"ok": True, "db": bool(DATABASE_URL)}
+
+@app.get("/readyz")
+async def readyz():
+    # Served from the background check; with checks disabled (interval 0) the broker
+    # connect runs on a thread so a probe never blocks the event loop.
+    check = health.status() if health.running else await run_in_threadpool(health.status)
+    body = {"ok": check["ok"], "check": check}
+    return body if check["ok"] else JSONResponse(status_code=503, content=body)
 
 @app.post("/orders")
 def create_order(req: OrderReq):
@@ -90,6 +149,8 @@ def create_order(req: OrderReq):
         raise HTTPException(status_code=400, detail="items required")
 
     order_id = str(uuid.uuid4())
+    # correlationId of the order.created event; forwarded on the payment call and the publish
+    set_correlation_id(order_id)
     created_at = datetime.datetime.utcnow().isoformat()
     raw_items = []
     order_items = []
@@ -149,4 +210,4 @@ if __name__ == "__main__":
     host = os.getenv("HOST", "127.0.0.1")
     port = int(os.getenv("PORT", "8000"))
     log_level = os.getenv("LOG_LEVEL", "info")
-    uvicorn.run("main:app", host=host, port=port, log_level=log_level, reload=True)
+    uvicorn.run(app, host=host, port=port, log_level=log_level)
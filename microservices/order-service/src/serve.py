@@ -0,0 +1,161 @@
+"""Production launcher: gunicorn with preloaded uvicorn workers, one per CPU of the pod's limit.
+
+    python serve.py
+
+- Workers: WEB_CONCURRENCY if set, else the cgroup CPU quota rounded up
+  (v2 `cpu.max`, v1 `cpu.cfs_quota_us`), else the CPUs this process may run
+  on; capped by MAX_WORKERS.
+- Event loop and HTTP parser: uvloop and httptools when installed
+  (uvicorn[standard]), otherwise asyncio and h11.
+- The app is imported once in the master and forked, so workers start warm
+  and share read-only pages. Backends are built lazily on first use, so every
+  worker opens its own connections after the fork.
+- SIGTERM: workers stop accepting, finish in-flight requests for up to
+  GRACEFUL_TIMEOUT seconds, then run the app's lifespan shutdown.
+- Metrics: with more than one worker, `/metrics` serves the pod-wide sum
+  (METRICS_MULTIPROC_DIR, see metrics.py); an exited worker's counters are
+  folded into the sum and its gauges dropped.
+
+Without gunicorn installed this falls back to uvicorn's multi-process mode,
+which imports the app in each worker instead of preloading it.
+"""
+import importlib.util
+import logging
+import math
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+
+APP = "main:app"
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "16"))
+GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", "25"))
+KEEPALIVE = int(os.getenv("KEEPALIVE_SECONDS", "5"))
+# Recycle workers after this many requests (plus jitter) to bound slow leaks; 0 = never
+MAX_REQUESTS = int(os.getenv("MAX_REQUESTS", "0"))
+ACCESS_LOG = os.getenv("ACCESS_LOG", "0").lower() in ("1", "true", "yes", "on")
+
+LOOP = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+HTTP = "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+logger = logging.getLogger("order-service")
+
+
+def cpu_quota() -> Optional[float]:
+    """CPUs granted by the container's cgroup CPU limit, or None when unlimited."""
+    try:  # cgroup v2: "<quota> <period>" or "max <period>"
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:  # cgroup v1: quota -1 means unlimited
+        quota = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+        period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+        return quota / period if quota > 0 and period > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not Linux
+        return os.cpu_count() or 1
+
+
+def worker_count() -> int:
+    configured = os.getenv("WEB_CONCURRENCY")
+    if configured:
+        return max(1, int(configured))
+    quota = cpu_quota()
+    cpus = min(available_cpus(), math.ceil(quota)) if quota else available_cpus()
+    return max(1, min(cpus, MAX_WORKERS))
+
+
+def _worker_class():
+    try:
+        from uvicorn_worker import UvicornWorker  # type: ignore
+    except ImportError:  # uvicorn < 0.30 ships the worker itself
+        from uvicorn.workers import UvicornWorker  # type: ignore
+
+    class Worker(UvicornWorker):
+        CONFIG_KWARGS = {"loop": LOOP, "http": HTTP, "lifespan": "on", "timeout_graceful_shutdown": GRACEFUL_TIMEOUT}
+
+    return Worker
+
+
+def run_gunicorn(workers: int) -> None:
+    from gunicorn.app.base import BaseApplication  # type: ignore
+    from gunicorn.util import import_app  # type: ignore
+
+    options = {
+        "bind": f"{HOST}:{PORT}",
+        "workers": workers,
+        "worker_class": _worker_class(),
+        "preload_app": True,
+        "graceful_timeout": math.ceil(GRACEFUL_TIMEOUT),  # gunicorn takes whole seconds
+        "keepalive": KEEPALIVE,
+        "max_requests": MAX_REQUESTS,
+        "max_requests_jitter": MAX_REQUESTS // 10,
+        "accesslog": "-" if ACCESS_LOG else None,
+    }
+
+    if os.getenv("METRICS_MULTIPROC_DIR"):
+        import metrics
+
+        def child_exit(server, worker):
+            metrics.mark_process_dead(worker.pid)
+
+        options["child_exit"] = child_exit
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return import_app(APP)
+
+    Application().run()
+
+
+def run_uvicorn(workers: int) -> None:
+    import uvicorn
+
+    uvicorn.run(
+        APP,
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        loop=LOOP,
+        http=HTTP,
+        timeout_keep_alive=KEEPALIVE,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        access_log=ACCESS_LOG,
+    )
+
+
+def main() -> None:
+    level = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+    logging.basicConfig(level=level, format="[order-service] %(levelname)s %(message)s")
+    workers = worker_count()
+    if workers > 1 and not os.getenv("METRICS_MULTIPROC_DIR"):
+        # /metrics sums every worker's series (see metrics.py); must be set before the app is imported.
+        os.environ["METRICS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="metrics-")
+    quota = cpu_quota()
+    logger.info(
+        "Starting %d worker(s) on %s:%d (cpu quota %s, loop %s, http %s)",
+        workers, HOST, PORT, f"{quota:g}" if quota else "unlimited", LOOP, HTTP,
+    )
+    if importlib.util.find_spec("gunicorn") is not None:
+        run_gunicorn(workers)
+    else:
+        logger.warning("gunicorn not installed; using uvicorn workers without preload")
+        run_uvicorn(workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import os, sys
+import json, os, sys
 from pathlib import Path
 
 # Ensure src is on the path
@@ -9,6 +9,12 @@ sys.path.insert(0, str(SRC))
 from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv())
 
+# Record every trace so /debug/traces can be checked below
+os.environ.setdefault("TRACE_SAMPLE_RATE", "1")
+# Small per-user bucket so the rate limit check below trips quickly
+os.environ.setdefault("RATE_LIMIT_USER_RPS", "1")
+os.environ.setdefault("RATE_LIMIT_USER_BURST", "5")
+
 from fastapi.testclient import TestClient
 import main
 
@@ -18,6 +24,8 @@ client = TestClient(main.app)
 r = client.get("/healthz")
 assert r.status_code == 200, r.text
 print("/healthz ->", r.json())
+r = client.get("/readyz")
+assert r.status_code == 200, r.text
 
 # Create order (publisher disabled -> should still succeed)
 payload = {
@@ -31,3 +39,40 @@ payload = {
 r = client.post("/orders", json=payload)
 assert r.status_code == 200, r.text
 print("/orders ->", r.json())
+
+# Metrics: route latency histogram keyed by route template
+r = client.get("/metrics")
+assert r.status_code == 200, r.text
+assert 'http_request_duration_seconds_count{method="POST",route="/orders",status="200"} 1' in r.text
+assert "order_payment_request_seconds" in r.text
+
+# Tracing: an incoming traceparent is continued and the payment call gets its own span
+trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+r = client.post("/orders", json=payload, headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"})
+assert r.status_code == 200, r.text
+assert r.headers["X-Trace-Id"] == trace_id
+traces = client.get("/debug/traces", params={"trace_id": trace_id}).json()["traces"]
+assert traces and traces[0]["correlation_id"] == r.json()["orderId"], traces
+names = [span["name"] for span in traces[0]["spans"]]
+assert names[0] == "POST /orders" and "payment.request" in names, names
+print("/debug/traces ->", names)
+
+# Admission control: one user hammering POST /orders is cut off with 429 + Retry-After,
+# before validation (empty orders are a 400 while the user still has tokens)
+bot = {"userId": "bot-1", "items": []}
+statuses = [client.post("/orders", json=bot).status_code for _ in range(8)]
+assert statuses[:5] == [400] * 5 and 429 in statuses, statuses
+r = client.post("/orders", json=bot)
+assert r.status_code == 429 and int(r.headers["Retry-After"]) >= 1, r.text
+assert client.post("/orders", json=payload).status_code == 200  # other users are unaffected
+assert 'admission_rejected_total{route="/orders",reason="user_rate_limited"}' in client.get("/metrics").text
+print("/orders rate limit ->", statuses)
+
+# The body is only buffered (to find userId) up to ADMISSION_MAX_BODY_BYTES; larger
+# orders skip the per-user limit and reach the app whole, with or without a Content-Length
+huge = {"userId": "user-123", "items": [{"sku": f"SKU-{n}", "qty": 1, "price": 1.0} for n in range(1000)]}
+r = client.post("/orders", json=huge)
+assert r.status_code == 200, r.text
+raw = json.dumps(huge).encode()
+r = client.post("/orders", content=iter([raw[:10000], raw[10000:20000], raw[20000:]]), headers={"content-type": "application/json"})
+assert r.status_code == 200, r.text